@@ -2,6 +2,9 @@
 """
 Add database indexes for better performance.
 Run this script to optimize database queries.
+
+Also builds the product search index used by /products/search against the app's
+configured database (Postgres: GIN index built CONCURRENTLY; SQLite: FTS5 table).
 """
 
 import sqlite3
@@ -34,6 +37,8 @@ def add_indexes():
             "CREATE INDEX IF NOT EXISTS idx_product_created_at ON product(created_at)",
             "CREATE INDEX IF NOT EXISTS idx_product_price ON product(price)",
             "CREATE INDEX IF NOT EXISTS idx_product_category_created ON product(category, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_product_created_id ON product(created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_product_vendor_created_id ON product(vendor_id, created_at, id)",
             
             # Indexes for User table
             "CREATE INDEX IF NOT EXISTS idx_user_email ON user(email)",
@@ -43,6 +48,16 @@ def add_indexes():
             "CREATE INDEX IF NOT EXISTS idx_order_user_id ON \"order\"(user_id)",
             "CREATE INDEX IF NOT EXISTS idx_order_status ON \"order\"(status)",
             "CREATE INDEX IF NOT EXISTS idx_order_created_at ON \"order\"(created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_order_user_created ON \"order\"(user_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_order_payment_status ON \"order\"(payment_status)",
+            "CREATE INDEX IF NOT EXISTS idx_order_created_id ON \"order\"(created_at, id)",
+
+            # Indexes for OrderItem table
+            "CREATE INDEX IF NOT EXISTS idx_order_item_order_id ON order_item(order_id)",
+
+            # Indexes for Review table
+            "CREATE INDEX IF NOT EXISTS idx_review_product_created ON review(product_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_review_product_rating_created ON review(product_id, rating, created_at)",
         ]
         
         for index_sql in indexes:
@@ -63,5 +78,36 @@ def add_indexes():
     finally:
         conn.close()
 
+def add_search_index():
+    """Create the product text index that /products/search uses when present."""
+    from sqlalchemy import text
+    from app import app, db, _PG_PRODUCT_TSV, _SQLITE_PRODUCT_FTS_DDL
+
+    with app.app_context():
+        engine = db.engine
+        if engine.name == 'postgresql':
+            # CONCURRENTLY keeps product writable during the build; it cannot run inside a transaction
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                valid = conn.execute(text(
+                    "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('idx_product_fts')"
+                )).scalar()
+                if valid is False:
+                    # Left behind by an interrupted concurrent build
+                    conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS idx_product_fts"))
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_product_fts ON product USING GIN ({_PG_PRODUCT_TSV})"))
+        elif engine.name == 'sqlite':
+            with engine.begin() as conn:
+                existed = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'product_fts'")).first() is not None
+                for ddl in _SQLITE_PRODUCT_FTS_DDL:
+                    conn.execute(text(ddl))
+                if not existed:
+                    # Index products that were written before the FTS table existed
+                    conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        else:
+            print(f"Product search index is not supported on {engine.name}; search will use LIKE.")
+            return
+    print("✓ Created index: product_fts (product search)")
+
 if __name__ == "__main__":
     add_indexes()
+    add_search_index()
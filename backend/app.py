@@ -4,14 +4,23 @@ import hashlib
 import traceback
 import secrets
 import json
-import requests
 import uuid
+import base64
+import re
+import gzip
+import random
+import smtplib
+from collections import OrderedDict
 from flask_mail import Mail, Message
-from sqlalchemy import text
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
 import threading
-import requests as _requests
+import time
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, redirect, session, send_from_directory
+from email.utils import formataddr
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, jsonify, request, redirect, session, send_from_directory, has_request_context, g
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from flask import make_response
@@ -21,9 +30,19 @@ from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 import psycopg2
 from config import DATABASE_URL, ADMIN_EMAIL, ADMIN_PASSWORD, CORS_ORIGINS, DEBUG, HOST, PORT
+import settings_cache
+import query_stats
+import metrics
+from db_pool import MeteredQueuePool
+from chapa_client import ChapaClient
 from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from pathlib import Path
 
+try:
+    import brotli  # optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
 def _sanitize_db_url(url: str) -> str:
     try:
         if not url:
@@ -69,7 +88,8 @@ _engine_options = {
     'pool_recycle': 280,
     'pool_size': int(os.getenv('SQL_POOL_SIZE', '5')),
     'max_overflow': int(os.getenv('SQL_MAX_OVERFLOW', '10')),
-    'pool_timeout': int(os.getenv('SQL_POOL_TIMEOUT', '30'))
+    'pool_timeout': int(os.getenv('SQL_POOL_TIMEOUT', '30')),
+    'poolclass': MeteredQueuePool,  # QueuePool that records checkout waits (replaced by StaticPool for in-memory SQLite)
 }
 
 # Only pass sslmode for Postgres psycopg/psycopg2 drivers; pg8000 uses a different param
@@ -90,6 +110,16 @@ CHAPA_OFFLINE = os.getenv('CHAPA_OFFLINE', 'false').lower() in ('1','true','yes'
 CHAPA_WEBHOOK_SECRET = os.getenv('CHAPA_WEBHOOK_SECRET', '').strip()
 CHAPA_DISABLE_RETURN = os.getenv('CHAPA_DISABLE_RETURN', 'false').lower() in ('1','true','yes','on')
 
+# Shared pooled gateway client (see chapa_client.py)
+chapa = ChapaClient(
+    base_url=CHAPA_BASE_URL,
+    secret_key=CHAPA_SECRET_KEY,
+    connect_timeout=float(os.getenv('CHAPA_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('CHAPA_READ_TIMEOUT', '15')),
+    pool_size=int(os.getenv('CHAPA_POOL_SIZE', '10')),
+    verify_retries=int(os.getenv('CHAPA_VERIFY_RETRIES', '2')),
+)
+
 # Log key presence at startup for easier diagnostics
 try:
     if not CHAPA_SECRET_KEY:
@@ -114,7 +144,7 @@ app.config['CAROUSEL_UPLOAD_FOLDER'] = CAROUSEL_UPLOAD_FOLDER
 # Email configuration
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', '587'))
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() in ('1', 'true', 'yes', 'on')
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
 
@@ -126,28 +156,175 @@ jwt = JWTManager(app)
 mail = Mail(app)
 
 # Configure CORS
-CORS(app, origins=CORS_ORIGINS)
+CORS(app, origins=CORS_ORIGINS, expose_headers=['X-Next-Cursor', 'X-DB-Queries'])
+
+# ----------------------
+# SQL instrumentation (per request)
+# ----------------------
+# Every request counts its statements, DB time and statement shapes (see query_stats.py).
+# With QUERY_STATS_HEADERS (default: on in debug) the totals are returned as Server-Timing
+# and X-DB-Queries headers; a shape executed more than QUERY_REPEAT_WARN times in one
+# request is logged as a likely N+1. Tests can assert budgets with query_stats.track().
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS_ENABLED', 'true').lower() == 'true'
+QUERY_STATS_HEADERS = os.getenv('QUERY_STATS_HEADERS', str(DEBUG)).lower() == 'true'
+QUERY_REPEAT_WARN = int(os.getenv('QUERY_REPEAT_WARN', '10'))
+
+@app.before_request
+def _start_query_stats():
+    if QUERY_STATS_ENABLED:
+        g.query_stats, g.query_stats_token = query_stats.start()
+
+@app.after_request
+def _report_query_stats(resp):
+    stats = g.get('query_stats')
+    if stats is None:
+        return resp
+    for shape, count in stats.repeated(QUERY_REPEAT_WARN):
+        print(f"[WARN] {request.method} {request.path}: statement ran {count}x (possible N+1): {shape[:200]}")
+    if QUERY_STATS_HEADERS:
+        resp.headers['X-DB-Queries'] = str(stats.count)
+        resp.headers.add('Server-Timing', f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"')
+    return resp
+
+@app.teardown_request
+def _stop_query_stats(_exc):
+    token = g.pop('query_stats_token', None)
+    if token is not None:
+        query_stats.stop(token)
 
 # ----------------------
-# Health check
+# Metrics (Prometheus)
 # ----------------------
+# GET /metrics serves request, pool, gateway and outbox metrics (see metrics.py). Under
+# gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a shared directory so a
+# scrape of any worker reports totals for all of them. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on scrapes.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+chapa.observers.append(metrics.observe_chapa)
+MeteredQueuePool.observers.append(metrics.observe_pool)
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    metrics.request_started()
+
+@app.after_request
+def _observe_request_metrics(resp):
+    start = g.get('metrics_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(request.method, route, resp.status_code, time.perf_counter() - start)
+    return resp
+
+@app.teardown_request
+def _finish_request_metrics(_exc):
+    if g.pop('metrics_start', None) is not None:
+        metrics.request_finished()
+
+def _sample_pool_metrics():
+    pool = db.engine.pool
+    if isinstance(pool, MeteredQueuePool):
+        metrics.sample_pool(pool)
+
+@app.get('/metrics')
+def get_metrics():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    _sample_pool_metrics()
+    rendered = metrics.render()
+    if rendered is None:
+        return jsonify({'error': 'Metrics are disabled (prometheus_client is not installed)'}), 503
+    body, content_type = rendered
+    resp = make_response(body)
+    resp.headers['Content-Type'] = content_type
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+# ----------------------
+# Health checks
+# ----------------------
+# /healthz (alias /livez) is liveness: the process is up and serving; it never touches the
+# database, so a slow DB does not get workers restarted. /readyz is readiness: it fails
+# with 503 when the database is unreachable or slow, the connection pool is saturated or
+# the mail outbox is backed up, so the load balancer stops routing to this worker. Its
+# result is cached per process for READY_CACHE_SECS, so frequent probes add no load.
+READY_DB_RTT_MS = float(os.getenv('READY_DB_RTT_MS', '250'))
+READY_POOL_WAIT_MS = float(os.getenv('READY_POOL_WAIT_MS', '1000'))
+READY_POOL_WAIT_WINDOW = float(os.getenv('READY_POOL_WAIT_WINDOW', '15'))
+READY_MAIL_BACKLOG = int(os.getenv('READY_MAIL_BACKLOG', '500'))
+READY_CACHE_SECS = float(os.getenv('READY_CACHE_SECS', '1'))
+_readiness = {'at': 0.0, 'result': None}
+_readiness_lock = threading.Lock()
+
 @app.route('/healthz', methods=['GET'])
+@app.route('/livez', methods=['GET'])
 def healthz():
-    try:
-        # Quick DB check (optional): run lightweight SELECT 1 for SQL-based backends
+    return jsonify({
+        'status': 'ok',
+        'version': os.getenv('APP_VERSION', 'v1'),
+        'time': datetime.utcnow().isoformat() + 'Z'
+    }), 200
+
+def _readiness_checks():
+    """Return (body, status code) for /readyz."""
+    failures = []
+    checks = {}
+
+    pool = db.engine.pool
+    saturated = False
+    if isinstance(pool, MeteredQueuePool):
+        usage = pool.usage()
+        wait_ms = pool.recent_wait(READY_POOL_WAIT_WINDOW) * 1000
+        saturated = usage['checked_out'] >= usage['size'] + usage['max_overflow']
+        checks['pool'] = dict(usage, recent_wait_ms=round(wait_ms, 1))
+        if saturated:
+            failures.append('pool: all connections checked out')
+        elif wait_ms > READY_POOL_WAIT_MS:
+            failures.append(f'pool: checkout wait {wait_ms:.0f}ms > {READY_POOL_WAIT_MS:.0f}ms')
+
+    if saturated:
+        # A checkout would block for pool_timeout; report the saturation instead
+        checks['db'] = {'skipped': True}
+    else:
         try:
-            with db.engine.connect() as connection:
-                connection.execute(text('SELECT 1'))
-        except Exception:
-            # If DB is not reachable, still return 200 to indicate app is up
-            pass
-        return jsonify({
-            'status': 'ok',
-            'version': os.getenv('APP_VERSION', 'v1'),
-            'time': datetime.utcnow().isoformat() + 'Z'
-        }), 200
-    except Exception:
-        return jsonify({'status': 'error'}), 500
+            start = time.perf_counter()
+            with db.engine.connect() as conn:
+                checked_out = time.perf_counter()
+                conn.execute(text('SELECT 1'))
+                rtt_ms = (time.perf_counter() - checked_out) * 1000
+                backlog = conn.execute(
+                    db.select(db.func.count(MailOutbox.id)).where(MailOutbox.state.in_(['pending', 'sending']))
+                ).scalar()
+            checks['db'] = {'rtt_ms': round(rtt_ms, 1), 'checkout_ms': round((checked_out - start) * 1000, 1)}
+            checks['mail'] = {'backlog': backlog}
+            if rtt_ms > READY_DB_RTT_MS:
+                failures.append(f'db: round trip {rtt_ms:.0f}ms > {READY_DB_RTT_MS:.0f}ms')
+            if backlog > READY_MAIL_BACKLOG:
+                failures.append(f'mail: {backlog} queued > {READY_MAIL_BACKLOG}')
+        except Exception as e:
+            checks['db'] = {'error': str(e)[:200]}
+            failures.append('db: unreachable')
+
+    body = {
+        'status': 'not_ready' if failures else 'ready',
+        'failures': failures,
+        'checks': checks,
+        'time': datetime.utcnow().isoformat() + 'Z',
+    }
+    return body, (503 if failures else 200)
+
+@app.get('/readyz')
+def readyz():
+    with _readiness_lock:
+        # Concurrent probes wait for the one in progress instead of stacking DB checks
+        if _readiness['result'] is None or time.monotonic() - _readiness['at'] >= READY_CACHE_SECS:
+            _readiness['result'] = _readiness_checks()
+            _readiness['at'] = time.monotonic()
+        body, status = _readiness['result']
+    resp = jsonify(body)
+    resp.status_code = status
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 # Commerce settings
 COMMISSION_RATE = float(os.getenv('COMMISSION_RATE', '0.10'))
@@ -178,17 +355,6 @@ def _is_valid_email(value: str) -> bool:
     except Exception:
         return False
 
-def _chapa_headers():
-    # Sanitize secret to ASCII-only for HTTP headers
-    secret = (CHAPA_SECRET_KEY or '').strip()
-    cleaned = ''.join(ch for ch in secret if ord(ch) < 128)
-    if cleaned != secret:
-        print('[WARN] CHAPA_SECRET_KEY contained non-ASCII characters; sanitized for header use.')
-    return {
-        'Authorization': f'Bearer {cleaned}',
-        'Content-Type': 'application/json'
-    }
-
 def initiate_chapa_payment(amount: float, currency: str, customer: dict, tx_ref: str) -> dict:
     """Create a Chapa checkout session and return response JSON."""
     if CHAPA_OFFLINE:
@@ -222,14 +388,10 @@ def initiate_chapa_payment(amount: float, currency: str, customer: dict, tx_ref:
         'callback_url': CHAPA_CALLBACK_URL,
     }
     try:
-        resp = requests.post(f"{CHAPA_BASE_URL}/v1/transaction/initialize", headers=_chapa_headers(), json=payload, timeout=20)
-        try:
-            data = resp.json()
-        except Exception:
-            data = {'status_code': resp.status_code, 'text': resp.text}
+        status_code, data = chapa.initialize(payload)
         # Print non-success for easier diagnostics
-        if (isinstance(data, dict) and data.get('status') != 'success') or resp.status_code >= 400:
-            print(f"[CHAPA INIT ERROR] status={resp.status_code} body={data}")
+        if (isinstance(data, dict) and data.get('status') != 'success') or status_code >= 400:
+            print(f"[CHAPA INIT ERROR] status={status_code} body={data}")
         return data
     except Exception as e:
         if CHAPA_OFFLINE:
@@ -244,25 +406,231 @@ def verify_chapa_transaction(tx_ref: str) -> dict:
     if not CHAPA_SECRET_KEY:
         return {'error': 'CHAPA_SECRET_KEY not configured'}
     try:
-        resp = requests.get(f"{CHAPA_BASE_URL}/v1/transaction/verify/{tx_ref}", headers=_chapa_headers(), timeout=20)
-        return resp.json()
+        _status_code, data = chapa.verify(tx_ref)
+        return data
     except Exception as e:
         return {'error': f'Failed to verify transaction: {e}'}
 
 # ----------------------
 # Admin Settings Helpers
 # ----------------------
+def _admin_settings_path() -> Path:
+    return Path(app.instance_path) / 'admin_settings.json'
+
+def _admin_categories_path() -> Path:
+    return Path(app.instance_path) / 'admin_categories.json'
+
+def _generation_path(name: str) -> Path:
+    return Path(app.instance_path) / f'{name}_generation.json'
+
+def _generation(name: str):
+    """Signature of a generation marker; changes whenever any worker bumps it."""
+    return settings_cache.signature(_generation_path(name))
+
+def _bump_generation(name: str):
+    try:
+        settings_cache.touch(_generation_path(name))
+    except Exception as e:
+        print(f"[WARN] Failed to bump {name} generation: {e}")
+
+def _catalog_generation():
+    return _generation('catalog')
+
+def _catalog_changed():
+    """Call after committing product or review writes so every worker drops catalog-derived caches."""
+    _bump_generation('catalog')
+    _cache_invalidate('home')
+
+def _carousel_changed():
+    """Call after committing carousel slide writes."""
+    _bump_generation('carousel')
+    _cache_invalidate('home')
+
 def _load_admin_settings() -> dict:
     try:
-        instance_dir = Path(app.instance_path)
-        instance_dir.mkdir(parents=True, exist_ok=True)
-        settings_path = instance_dir / 'admin_settings.json'
-        if settings_path.exists():
-            with settings_path.open('r', encoding='utf-8') as f:
-                return json.load(f) or {}
+        data = settings_cache.read_json(_admin_settings_path(), default={})
+        return data if isinstance(data, dict) else {}
     except Exception:
-        pass
-    return {}
+        return {}
+
+def _load_admin_categories() -> list:
+    try:
+        data = settings_cache.read_json(_admin_categories_path(), default=[])
+        return data if isinstance(data, list) else []
+    except Exception:
+        return []
+
+# ----------------------
+# In-process TTL cache (per worker; keep TTLs short)
+# ----------------------
+_ttl_cache = {}
+_ttl_cache_lock = threading.Lock()
+
+def _cached(key, ttl: float, loader):
+    """Return loader() and memoize it under key for ttl seconds."""
+    now = time.monotonic()
+    with _ttl_cache_lock:
+        hit = _ttl_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    value = loader()
+    with _ttl_cache_lock:
+        _ttl_cache[key] = (now + ttl, value)
+    return value
+
+def _cache_invalidate(prefix: str):
+    """Drop every cached entry whose key is a tuple starting with prefix."""
+    with _ttl_cache_lock:
+        for key in [k for k in _ttl_cache if isinstance(k, tuple) and k and k[0] == prefix]:
+            _ttl_cache.pop(key, None)
+
+ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', '10'))
+
+# ----------------------
+# HTTP conditional GET (ETag / Last-Modified)
+# ----------------------
+# A watermark function returns (token, last_modified) for the data a view renders, using a
+# query or marker-file stat far cheaper than the view itself, or None to skip validation (e.g. 404s).
+# Matching If-None-Match / If-Modified-Since requests get a 304 without running the view.
+
+def _etag_for(token) -> str:
+    raw = json.dumps([request.path, sorted(request.args.items(multi=True)), token], default=str, separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:32]
+
+def _not_modified(etag: str, last_modified) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+def _conditional_get(watermark):
+    """Decorator adding weak ETag/Last-Modified validators derived from watermark(**view_args)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                mark = watermark(**kwargs)
+            except Exception as e:
+                print(f"[WARN] Conditional GET watermark failed for {request.path}: {e}")
+                mark = None
+            if mark is None:
+                return view(*args, **kwargs)
+            token, last_modified = mark
+            etag = _etag_for(token)
+            if _not_modified(etag, last_modified):
+                resp = app.response_class(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag, weak=True)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            resp.headers['Cache-Control'] = 'public, no-cache'
+            return resp
+        return wrapper
+    return decorator
+
+def _catalog_watermark(**_kwargs):
+    """Product list watermark: the catalog generation marker, so validation needs no DB work.
+
+    Product, review, rating repair and stock writes all bump the marker (_catalog_changed).
+    """
+    gen = _catalog_generation()
+    if gen is None:
+        # No write since the instance folder was created: start a generation to validate against
+        _bump_generation('catalog')
+        gen = _catalog_generation()
+        if gen is None:
+            return None
+    return gen, datetime.utcfromtimestamp(gen[0] / 1e9)
+
+def _product_watermark(product_id: int, **_kwargs):
+    row = db.session.query(Product.updated_at, User.updated_at, ProductRating.updated_at, ProductRating.rating_count).outerjoin(
+        User, Product.vendor_id == User.id
+    ).outerjoin(ProductRating, ProductRating.product_id == Product.id).filter(Product.id == product_id).first()
+    if row is None:
+        return None
+    last_modified = max([d for d in row[:3] if d is not None], default=None)
+    return tuple(row), last_modified
+
+def _carousel_watermark(**_kwargs):
+    count, max_id, updated = db.session.query(
+        db.func.count(CarouselSlide.id), db.func.max(CarouselSlide.id), db.func.max(CarouselSlide.updated_at)
+    ).one()
+    return (count, max_id, updated), updated
+
+def _categories_watermark(**_kwargs):
+    sig = settings_cache.signature(_admin_categories_path())
+    return sig, (datetime.utcfromtimestamp(sig[0] / 1e9) if sig else None)
+
+# ----------------------
+# Response compression (negotiated via Accept-Encoding)
+# ----------------------
+# JSON/text bodies above COMPRESS_MIN_SIZE are brotli- or gzip-encoded. Endpoints in
+# _PRECOMPRESS_ENDPOINTS serve identical bodies to most visitors, so their encoded bytes
+# are kept per worker, keyed by a hash of the body, and reused until the body changes.
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5'))
+_COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv', 'text/css', 'application/javascript')
+_PRECOMPRESS_ENDPOINTS = {'get_featured_products', 'get_carousel_slides', 'get_home'}
+_PRECOMPRESS_MAX_ENTRIES = 64
+_precompressed = OrderedDict()  # (encoding, body sha1) -> encoded bytes
+_precompressed_lock = threading.Lock()
+
+def _negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+def _encode_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+def _encode_body_cached(body: bytes, encoding: str) -> bytes:
+    key = (encoding, hashlib.sha1(body).digest())
+    with _precompressed_lock:
+        hit = _precompressed.get(key)
+        if hit is not None:
+            _precompressed.move_to_end(key)
+            return hit
+    encoded = _encode_body(body, encoding)
+    with _precompressed_lock:
+        _precompressed[key] = encoded
+        while len(_precompressed) > _PRECOMPRESS_MAX_ENTRIES:
+            _precompressed.popitem(last=False)
+    return encoded
+
+@app.after_request
+def _compress_response(resp):
+    if resp.direct_passthrough or resp.is_streamed or resp.mimetype not in _COMPRESSIBLE_MIMETYPES:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if resp.status_code != 200 or 'Content-Encoding' in resp.headers:
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return resp
+    encoding = _negotiate_encoding()
+    if encoding is None:
+        return resp
+    try:
+        if request.endpoint in _PRECOMPRESS_ENDPOINTS:
+            encoded = _encode_body_cached(body, encoding)
+        else:
+            encoded = _encode_body(body, encoding)
+    except Exception as e:
+        print(f"[WARN] Response compression failed for {request.path}: {e}")
+        return resp
+    resp.set_data(encoded)
+    resp.headers['Content-Encoding'] = encoding
+    return resp
 
 # Database Models
 class User(db.Model):
@@ -358,6 +726,11 @@ class Review(db.Model):
     product = db.relationship('Product', backref='reviews')
     user = db.relationship('User', backref='reviews')
 
+    __table_args__ = (
+        db.Index('idx_review_product_created', 'product_id', 'created_at', 'id'),
+        db.Index('idx_review_product_rating_created', 'product_id', 'rating', 'created_at'),
+    )
+
 class Refund(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -417,6 +790,76 @@ class WithdrawalRequest(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class DailySalesRollup(db.Model):
+    """Paid sales pre-aggregated per (day, vendor, category) for dashboard queries."""
+    __tablename__ = 'daily_sales_rollup'
+    __table_args__ = (db.UniqueConstraint('day', 'vendor_id', 'category', name='uq_daily_sales_rollup_key'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    vendor_id = db.Column(db.Integer, nullable=False, default=0)
+    category = db.Column(db.String(50), nullable=False, default='Uncategorized')
+    gross = db.Column(db.Float, nullable=False, default=0.0)
+    net = db.Column(db.Float, nullable=False, default=0.0)
+    commission = db.Column(db.Float, nullable=False, default=0.0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ProductRating(db.Model):
+    """Review aggregates per product, maintained by create_review() so reads never scan reviews."""
+    __tablename__ = 'product_rating'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    count_1 = db.Column(db.Integer, nullable=False, default=0)
+    count_2 = db.Column(db.Integer, nullable=False, default=0)
+    count_3 = db.Column(db.Integer, nullable=False, default=0)
+    count_4 = db.Column(db.Integer, nullable=False, default=0)
+    count_5 = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PaymentEvent(db.Model):
+    """Inbox of gateway callbacks, one row per tx_ref, processed by the payment event worker."""
+    __tablename__ = 'payment_event'
+    id = db.Column(db.Integer, primary_key=True)
+    tx_ref = db.Column(db.String(100), nullable=False, unique=True)
+    payload = db.Column(db.Text, nullable=True)
+    state = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, processing, done, failed
+    outcome = db.Column(db.String(20), nullable=True)  # paid, already_paid, not_paid, not_found
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+class MailOutbox(db.Model):
+    """Outgoing email, persisted until the mail outbox worker has handed it to the SMTP server."""
+    __tablename__ = 'mail_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    sender = db.Column(db.String(255), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    state = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class StockReservation(db.Model):
+    """Stock taken from a product for an order; released_at is set once it has been given back."""
+    __tablename__ = 'stock_reservation'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)
+
 # ----------------------
 # Commission and wallet helpers
 # ----------------------
@@ -507,6 +950,286 @@ def _insert_order_compat(user_id: int, total_amount: float, status: str, payment
     except Exception:
         raise
 
+# ----------------------
+# Cart resolution helper (shared by checkout and place-order)
+# ----------------------
+
+def _cart_item_pid(it):
+    try:
+        return (
+            it.get('product_id') or it.get('productId') or it.get('id') or
+            ((it.get('product') or {}).get('id'))
+        )
+    except Exception:
+        return None
+
+def _resolve_cart_lines(items: list) -> tuple[dict, float]:
+    """Resolve raw cart items into {vendor_id: [(product, qty), ...]} and the cart total.
+
+    All referenced products are fetched with a single IN (...) query instead of one
+    lookup per line. Invalid lines (missing id, non-positive qty, unknown product) are skipped.
+    """
+    parsed = []
+    for it in items or []:
+        pid = _cart_item_pid(it)
+        try:
+            pid = int(pid) if pid is not None else None
+            qty = int(it.get('quantity') or 0)
+        except Exception:
+            pid, qty = None, 0
+        if not pid or qty <= 0:
+            if DEBUG:
+                print(f"[CHECKOUT] Skipping invalid item: {it}")
+            continue
+        parsed.append((pid, qty))
+    if not parsed:
+        return {}, 0.0
+
+    pids = {pid for pid, _ in parsed}
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(pids)).all()}
+
+    vendor_to_lines = {}
+    total_amount = 0.0
+    for pid, qty in parsed:
+        product = products.get(pid)
+        if not product:
+            if DEBUG:
+                print(f"[CHECKOUT] Product not found: {pid}")
+            continue
+        total_amount += product.price * qty
+        vendor_to_lines.setdefault(product.vendor_id or 0, []).append((product, qty))
+    return vendor_to_lines, total_amount
+
+# ----------------------
+# Inventory reservations
+# ----------------------
+# Stock is taken when an order is created, in the same transaction, with one conditional
+# UPDATE per cart; a cart that cannot be fully served changes nothing. Each hold is recorded
+# in stock_reservation so releasing it (payment failure, expiry) happens at most once.
+
+def _stock_changed():
+    """Stock feeds the facet index and /home; bump the catalog generation when this transaction commits."""
+    db.session.info['catalog_changed'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_catalog_after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        _catalog_changed()
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_catalog_change(session):
+    session.info.pop('catalog_changed', None)
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages: list):
+        super().__init__('Insufficient stock')
+        self.shortages = shortages
+
+def _qty_by_product(order_lines) -> dict:
+    wanted = {}
+    for _order, lines in order_lines:
+        for product, qty in lines:
+            wanted[product.id] = wanted.get(product.id, 0) + qty
+    return wanted
+
+def _reserve_stock(order_lines):
+    """Take stock for [(order, [(product, qty), ...]), ...] or raise InsufficientStock.
+
+    The caller owns the transaction and must roll back on InsufficientStock.
+    """
+    wanted = _qty_by_product(order_lines)
+    if not wanted:
+        return
+    qty = db.case(wanted, value=Product.id)
+    updated = Product.query.filter(
+        Product.id.in_(list(wanted)), Product.stock_quantity >= qty
+    ).update({Product.stock_quantity: Product.stock_quantity - qty}, synchronize_session=False)
+    if updated != len(wanted):
+        rows = db.session.query(Product.id, Product.name, Product.stock_quantity).filter(Product.id.in_(list(wanted))).all()
+        raise InsufficientStock([
+            {'product_id': pid, 'name': name, 'requested': wanted[pid], 'available': max(stock or 0, 0)}
+            for pid, name, stock in rows if (stock or 0) < wanted[pid]
+        ])
+    for order, lines in order_lines:
+        for product, q in lines:
+            db.session.add(StockReservation(order_id=order.id, product_id=product.id, quantity=q))
+    _stock_changed()
+
+def _adjust_stock(deltas: dict):
+    """Apply {product_id: delta} in one UPDATE, never taking stock below zero."""
+    deltas = {pid: d for pid, d in deltas.items() if d}
+    if not deltas:
+        return
+    delta = db.case(deltas, value=Product.id)
+    current = db.func.coalesce(Product.stock_quantity, 0)
+    Product.query.filter(Product.id.in_(list(deltas))).update(
+        {Product.stock_quantity: db.case((current + delta < 0, 0), else_=current + delta)},
+        synchronize_session=False
+    )
+    _stock_changed()
+
+def _release_stock(order_ids) -> int:
+    """Return held stock for these orders to their products; safe to call repeatedly. Returns units released."""
+    order_ids = [oid for oid in order_ids if oid]
+    if not order_ids:
+        return 0
+    # Claim the holds and read their quantities in one statement so concurrent releases cannot double count
+    claimed = db.session.execute(
+        db.update(StockReservation)
+        .where(StockReservation.order_id.in_(order_ids), StockReservation.released_at.is_(None))
+        .values(released_at=datetime.utcnow())
+        .returning(StockReservation.product_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    deltas = {}
+    for pid, q in claimed:
+        deltas[pid] = deltas.get(pid, 0) + q
+    _adjust_stock(deltas)
+    return sum(deltas.values())
+
+def _reacquire_stock(order_ids):
+    """An order paid after its hold was released (late verify): take the stock again.
+
+    The sale already happened, so this is unconditional and floors stock at zero.
+    """
+    order_ids = [oid for oid in order_ids if oid]
+    if not order_ids:
+        return
+    reclaimed = db.session.execute(
+        db.update(StockReservation)
+        .where(StockReservation.order_id.in_(order_ids), StockReservation.released_at.isnot(None))
+        .values(released_at=None)
+        .returning(StockReservation.product_id, StockReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    deltas = {}
+    for pid, q in reclaimed:
+        deltas[pid] = deltas.get(pid, 0) - q
+    _adjust_stock(deltas)
+
+def _order_ids_for_tx(tx_ref: str, parent=None) -> list:
+    """Every order paid through tx_ref (a single-mode payment covers all child orders)."""
+    cond = Order.payment_reference == tx_ref
+    if parent is not None:
+        cond = db.or_(cond, Order.parent_order_id == parent.id)
+    return [oid for (oid,) in db.session.query(Order.id).filter(cond).all()]
+
+def _insufficient_stock_response(e: InsufficientStock):
+    return jsonify({'error': 'Some items are out of stock', 'out_of_stock': e.shortages}), 409
+
+# ----------------------
+# Pending order expiry (honors orders.orderAutoExpireMins)
+# ----------------------
+# Abandoned Chapa checkouts (payment_method 'chapa', still 'pending' and unpaid after
+# orderAutoExpireMins) are cancelled and their stock holds released. COD and bank-transfer
+# orders are unpaid by design until delivery or confirmation and are never expired. Work is done in bounded batches of set-based statements, each committed
+# on its own, so the order table is never locked for long. Every worker may run the loop:
+# the conditional UPDATE and the reservation claim make concurrent sweeps harmless.
+ORDER_EXPIRY_SWEEPER = os.getenv('ORDER_EXPIRY_SWEEPER', 'true').lower() in ('1', 'true', 'yes', 'on')
+ORDER_EXPIRY_INTERVAL = float(os.getenv('ORDER_EXPIRY_INTERVAL', '60'))
+ORDER_EXPIRY_BATCH = int(os.getenv('ORDER_EXPIRY_BATCH', '200'))
+_order_expiry_thread = None
+_order_expiry_lock = threading.Lock()
+
+def _order_expiry_minutes():
+    try:
+        mins = int((_load_admin_settings().get('orders') or {}).get('orderAutoExpireMins') or 0)
+    except (TypeError, ValueError):
+        return None
+    return mins if mins > 0 else None
+
+def _expire_stale_orders(batch_size: int = ORDER_EXPIRY_BATCH, max_batches: int = None) -> int:
+    """Cancel unpaid pending Chapa checkouts older than the configured window. Returns orders expired."""
+    mins = _order_expiry_minutes()
+    if not mins:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(minutes=mins)
+    # Only online checkouts: COD and transfer orders stay unpaid until delivery/confirmation
+    abandoned = db.and_(Order.status == 'pending', Order.payment_method == 'chapa',
+                        db.or_(Order.payment_status.is_(None), Order.payment_status != 'paid'))
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = [oid for (oid,) in db.session.query(Order.id).filter(
+            abandoned, Order.created_at < cutoff
+        ).order_by(Order.id).limit(batch_size).all()]
+        if not ids:
+            break
+        # Re-check the state in the UPDATE itself: a payment may have landed since the SELECT
+        expired = db.session.execute(
+            db.update(Order)
+            .where(Order.id.in_(ids), abandoned)
+            .values(status='cancelled', updated_at=datetime.utcnow())
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        _release_stock(expired)
+        db.session.commit()
+        total += len(expired)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+    return total
+
+def _order_expiry_loop():
+    while True:
+        # Jitter so workers started together do not sweep in lockstep
+        time.sleep(ORDER_EXPIRY_INTERVAL * random.uniform(0.75, 1.25))
+        try:
+            with app.app_context():
+                expired = _expire_stale_orders()
+                if expired:
+                    print(f"[INFO] Expired {expired} abandoned Chapa checkout(s)")
+        except Exception as e:
+            print(f"[WARN] Order expiry sweep failed: {e}")
+
+@app.before_request
+def _start_order_expiry_sweeper():
+    # Started lazily from the first request so scripts that import app do not spawn it
+    global _order_expiry_thread
+    if not ORDER_EXPIRY_SWEEPER or _order_expiry_thread is not None:
+        return
+    with _order_expiry_lock:
+        if _order_expiry_thread is None:
+            _order_expiry_thread = threading.Thread(target=_order_expiry_loop, name='order-expiry', daemon=True)
+            _order_expiry_thread.start()
+
+# ----------------------
+# Keyset pagination helpers
+# ----------------------
+
+def _encode_cursor(*values) -> str:
+    """Pack sort-key values into an opaque, URL-safe cursor string."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str) -> list | None:
+    """Inverse of _encode_cursor; returns None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return values if isinstance(values, list) else None
+    except Exception:
+        return None
+
+def _keyset_after(created_col, id_col, cursor_values):
+    """Filter for rows strictly after (created_at, id) when ordered newest first."""
+    created_at = datetime.fromisoformat(cursor_values[0])
+    last_id = int(cursor_values[1])
+    return db.or_(created_col < created_at, db.and_(created_col == created_at, id_col < last_id))
+
+def _page_args(default_limit: int = 50, max_limit: int = 200) -> tuple[int, list | None]:
+    """Read ?limit= and ?cursor= from the request. Raises ValueError on a bad cursor."""
+    limit = request.args.get('limit', default_limit, type=int) or default_limit
+    limit = max(1, min(limit, max_limit))
+    raw_cursor = (request.args.get('cursor') or '').strip()
+    cursor_values = _decode_cursor(raw_cursor)
+    if raw_cursor and cursor_values is None:
+        raise ValueError('Invalid cursor')
+    return limit, cursor_values
+
 def _release_commission_on_complete(order: Order):
     try:
         items = OrderItem.query.filter_by(order_id=order.id).all()
@@ -534,19 +1257,318 @@ def _release_commission_on_complete(order: Order):
     except Exception:
         pass
 
-# Email functions
-def _send_mail_async(app: Flask, msg: Message):
-    with app.app_context():
+# ----------------------
+# Daily sales rollup (incremental on payment, full rebuild via backfill_sales_rollup.py)
+# ----------------------
+
+def _rollup_bucket_key(day, vendor_id, category):
+    return (day, int(vendor_id or 0), (category or 'Uncategorized')[:50])
+
+def _rollup_apply(buckets: dict):
+    """Add {(day, vendor_id, category): {'gross', 'items', 'orders'}} onto the rollup rows."""
+    for (day, vendor_id, category), agg in buckets.items():
+        gross = round(agg['gross'], 2)
+        commission = round(gross * COMMISSION_RATE, 2)
+        deltas = {
+            DailySalesRollup.gross: DailySalesRollup.gross + gross,
+            DailySalesRollup.commission: DailySalesRollup.commission + commission,
+            DailySalesRollup.net: DailySalesRollup.net + round(gross - commission, 2),
+            DailySalesRollup.order_count: DailySalesRollup.order_count + len(agg['orders']),
+            DailySalesRollup.item_count: DailySalesRollup.item_count + agg['items'],
+            DailySalesRollup.updated_at: datetime.utcnow(),
+        }
+        key = DailySalesRollup.query.filter_by(day=day, vendor_id=vendor_id, category=category)
+        if key.update(deltas, synchronize_session=False):
+            continue
         try:
-            mail.send(msg)
-            print(f"Email sent successfully to {msg.recipients}")
-        except Exception as e:
-            print(f"Failed to send email: {e}")
+            with db.session.begin_nested():
+                db.session.add(DailySalesRollup(
+                    day=day, vendor_id=vendor_id, category=category,
+                    gross=gross, commission=commission, net=round(gross - commission, 2),
+                    order_count=len(agg['orders']), item_count=agg['items']
+                ))
+        except IntegrityError:
+            # Another worker inserted the same key first; fall back to incrementing it
+            key.update(deltas, synchronize_session=False)
+
+def _rollup_add_paid_orders(order_ids: list):
+    """Fold orders that just became paid into today's rollup rows.
+
+    Callers must pass only orders transitioning to paid (see _mark_orders_paid) so repeated
+    verifies do not double count. Runs inside a savepoint: a rollup failure never blocks
+    the payment update itself.
+    """
+    order_ids = [oid for oid in order_ids if oid]
+    if not order_ids:
+        return
+    paid_day = datetime.utcnow().date()
+    try:
+        with db.session.begin_nested():
+            rows = db.session.query(
+                OrderItem.order_id, Product.vendor_id, Product.category, OrderItem.price, OrderItem.quantity
+            ).outerjoin(Product, OrderItem.product_id == Product.id).filter(OrderItem.order_id.in_(order_ids)).all()
+            buckets = {}
+            for order_id, vendor_id, category, price, qty in rows:
+                agg = buckets.setdefault(_rollup_bucket_key(paid_day, vendor_id, category), {'gross': 0.0, 'items': 0, 'orders': set()})
+                agg['gross'] += float(price or 0.0) * int(qty or 0)
+                agg['items'] += int(qty or 0)
+                agg['orders'].add(order_id)
+            _rollup_apply(buckets)
+    except Exception as e:
+        print(f"[WARN] Sales rollup update failed: {e}")
+
+def _mark_orders_paid(order_ids: list, receipt: bool = False) -> list:
+    """Flip these orders to paid and apply the side effects of the transition. Does not commit.
+
+    The transition is decided by one conditional UPDATE ... RETURNING, so when the browser
+    verify, the callback worker and reconcile race on one tx_ref, each order is reported
+    as newly paid to exactly one of them; only those ids feed the sales rollup and take
+    back released stock. Returns the ids that transitioned.
+    """
+    order_ids = [oid for oid in order_ids if oid]
+    if not order_ids:
+        return []
+    values = {'status': 'completed', 'payment_status': 'paid', 'updated_at': datetime.utcnow()}
+    if receipt:
+        values['receipt_url'] = '/orders/' + db.cast(Order.id, db.String) + '/invoice'
+    newly_paid = db.session.execute(
+        db.update(Order)
+        .where(Order.id.in_(order_ids), db.or_(Order.payment_status.is_(None), Order.payment_status != 'paid'))
+        .values(**values)
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    _rollup_add_paid_orders(newly_paid)
+    _reacquire_stock(newly_paid)
+    return newly_paid
+
+def _rollup_rebuild(since: datetime | None = None) -> int:
+    """Recompute rollup rows from paid order history (all days, or days >= since). Commits."""
+    paid_at = db.func.coalesce(Order.updated_at, Order.created_at)
+    stale = DailySalesRollup.query
+    if since is not None:
+        stale = stale.filter(DailySalesRollup.day >= since.date())
+    stale.delete(synchronize_session=False)
+
+    day = _sql_day(paid_at)
+    q = db.session.query(
+        day, Product.vendor_id, Product.category,
+        db.func.sum(OrderItem.price * OrderItem.quantity),
+        db.func.sum(OrderItem.quantity),
+        db.func.count(db.distinct(Order.id))
+    ).select_from(OrderItem).join(Order, OrderItem.order_id == Order.id).outerjoin(
+        Product, OrderItem.product_id == Product.id
+    ).filter(Order.payment_status == 'paid')
+    if since is not None:
+        q = q.filter(paid_at >= datetime(since.year, since.month, since.day))
+    buckets = {}
+    for d, vendor_id, category, gross, items, n_orders in q.group_by(day, Product.vendor_id, Product.category).all():
+        if d is None:
+            continue
+        key = _rollup_bucket_key(datetime.strptime(_day_key(d), '%Y-%m-%d').date(), vendor_id, category)
+        agg = buckets.setdefault(key, {'gross': 0.0, 'items': 0, 'orders': 0})
+        agg['gross'] += float(gross or 0.0)
+        agg['items'] += int(items or 0)
+        agg['orders'] += int(n_orders or 0)
+    for (d, vendor_id, category), agg in buckets.items():
+        gross = round(agg['gross'], 2)
+        commission = round(gross * COMMISSION_RATE, 2)
+        db.session.add(DailySalesRollup(
+            day=d, vendor_id=vendor_id, category=category,
+            gross=gross, commission=commission, net=round(gross - commission, 2),
+            order_count=agg['orders'], item_count=agg['items']
+        ))
+    db.session.commit()
+    if since is None:
+        # Full history is now in the table; reports may switch over to it
+        settings_cache.write_json(_rollup_marker_path(), {'backfilled_at': datetime.utcnow().isoformat() + 'Z'})
+    return len(buckets)
+
+def _rollup_marker_path() -> Path:
+    return Path(app.instance_path) / 'sales_rollup_backfill.json'
+
+def _rollup_ready() -> bool:
+    """True once a full _rollup_rebuild() (backfill_sales_rollup.py) has completed.
+
+    Rows alone are not enough: the first payment after deploy creates one through
+    _rollup_add_paid_orders, and switching then would drop all earlier history.
+    """
+    return bool(settings_cache.read_json(_rollup_marker_path(), default=None))
+
+# Email functions
+# ----------------------
+# Outgoing mail is written to the mail_outbox table and sent by one worker thread per
+# process, so a burst of notifications never spawns a thread or SMTP connection per
+# message. The worker claims due rows with a conditional UPDATE (safe with several
+# gunicorn workers), sends the whole batch over a single SMTP connection and retries
+# failures with exponential backoff. Rows stay pending across restarts and are picked up
+# by the next poll. For local testing point MAIL_SERVER/MAIL_PORT at an SMTP sink
+# (see smtp_sink.py) with MAIL_USE_TLS=false.
+MAIL_OUTBOX_BATCH = int(os.getenv('MAIL_OUTBOX_BATCH', '50'))
+MAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+MAIL_OUTBOX_POLL_SECS = float(os.getenv('MAIL_OUTBOX_POLL_SECS', '15'))
+MAIL_OUTBOX_STALE_SECS = 600  # a 'sending' claim older than this is assumed lost
+_mail_outbox_wakeup = threading.Event()
+_mail_outbox_thread = None
+_mail_outbox_lock = threading.Lock()
+
+def _mail_sender(msg: Message) -> str:
+    sender = msg.sender or app.config.get('MAIL_DEFAULT_SENDER') or app.config['MAIL_USERNAME'] or 'no-reply@example.com'
+    if isinstance(sender, (tuple, list)):
+        sender = formataddr(tuple(sender))
+    return sender
+
+def enqueue_mail(messages: list) -> int:
+    """Persist messages to the outbox in one insert, commit, and wake the worker.
+
+    Commits the current session, so call it after the caller's own work is committed.
+    Returns the number of rows queued.
+    """
+    rows = [
+        MailOutbox(sender=_mail_sender(m), recipients=json.dumps(list(m.recipients or [])),
+                   subject=(m.subject or '')[:255], body=m.body, html=m.html)
+        for m in messages if m.recipients
+    ]
+    if not rows:
+        return 0
+    db.session.add_all(rows)
+    db.session.commit()
+    _wake_mail_outbox_worker()
+    return len(rows)
 
 def send_mail_background(msg: Message):
-    thread = threading.Thread(target=_send_mail_async, args=(app, msg))
-    thread.daemon = True
-    thread.start()
+    enqueue_mail([msg])
+
+def _vendor_recipients(order_ids: list) -> dict:
+    """{vendor email: [order ids]} for the given orders, resolved in one joined query."""
+    if not order_ids:
+        return {}
+    rows = (
+        db.session.query(OrderItem.order_id, User.email)
+        .join(Product, Product.id == OrderItem.product_id)
+        .join(User, User.id == Product.vendor_id)
+        .filter(OrderItem.order_id.in_(order_ids), User.email.isnot(None), User.email != '')
+        .distinct()
+        .all()
+    )
+    recipients = {}
+    for order_id, email in sorted(rows):
+        recipients.setdefault(email, []).append(order_id)
+    return recipients
+
+def _order_notifications(kind: str, orders: list, admin_body: str = None) -> list:
+    """Plan the emails for newly placed ('placed') or paid ('paid') orders.
+
+    Each vendor gets a single email covering all of their orders (for paid orders it
+    carries the invoice links too); the admin gets admin_body when ADMIN_EMAIL is set.
+    """
+    sender = app.config['MAIL_USERNAME'] or 'no-reply@example.com'
+    messages = []
+    for email, order_ids in _vendor_recipients([o.id for o in orders]).items():
+        if kind == 'paid':
+            lines = [
+                f'Order #{oid} has been paid. Please fulfill.\n'
+                f'Download the invoice: {_public_base_url()}/orders/{oid}/invoice'
+                for oid in order_ids
+            ]
+            subject = 'New Order Paid'
+        else:
+            lines = [f'Order #{oid} has been placed and is pending payment. Please prepare for fulfillment.' for oid in order_ids]
+            subject = 'New Order Placed'
+        messages.append(Message(subject=subject, sender=sender, recipients=[email], body='\n\n'.join(lines)))
+    if ADMIN_EMAIL and admin_body:
+        subject = 'New Paid Order (Invoice)' if kind == 'paid' else 'New Pending Order(s)'
+        messages.append(Message(subject=subject, sender=sender, recipients=[ADMIN_EMAIL], body=admin_body))
+    return messages
+
+def _mail_outbox_depth() -> int:
+    """Messages still waiting to be sent (pending or mid-send)."""
+    return MailOutbox.query.filter(MailOutbox.state.in_(['pending', 'sending'])).count()
+
+metrics.gauge_callback('mail_outbox_depth', 'Emails waiting in the outbox', _mail_outbox_depth)
+
+def _claim_mail_outbox(limit: int) -> list:
+    now = datetime.utcnow()
+    due = db.or_(
+        db.and_(MailOutbox.state == 'pending', MailOutbox.next_attempt_at <= now),
+        db.and_(MailOutbox.state == 'sending', MailOutbox.claimed_at < now - timedelta(seconds=MAIL_OUTBOX_STALE_SECS)),
+    )
+    ids = [mid for (mid,) in db.session.query(MailOutbox.id).filter(due).order_by(MailOutbox.id).limit(limit).all()]
+    if not ids:
+        return []
+    claimed = db.session.execute(
+        db.update(MailOutbox)
+        .where(MailOutbox.id.in_(ids), due)
+        .values(state='sending', claimed_at=now, attempts=MailOutbox.attempts + 1)
+        .returning(MailOutbox.id, MailOutbox.sender, MailOutbox.recipients, MailOutbox.subject,
+                   MailOutbox.body, MailOutbox.html, MailOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return sorted(claimed, key=lambda r: r.id)
+
+def _mail_failed(row, error: Exception) -> dict:
+    if row.attempts >= MAIL_OUTBOX_MAX_ATTEMPTS:
+        print(f"[WARN] Email #{row.id} to {row.recipients} failed after {row.attempts} attempt(s): {error}")
+        return {'state': 'failed', 'last_error': str(error)[:500]}
+    delay = min(30 * (2 ** (row.attempts - 1)), 3600) * random.uniform(0.8, 1.2)
+    return {'state': 'pending', 'last_error': str(error)[:500], 'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)}
+
+def _process_mail_outbox(limit: int = MAIL_OUTBOX_BATCH) -> int:
+    """Send one batch of due messages over a single SMTP connection. Returns how many were claimed."""
+    claimed = _claim_mail_outbox(limit)
+    if not claimed:
+        return 0
+    results = {}
+    try:
+        with mail.connect() as conn:
+            for row in claimed:
+                msg = Message(subject=row.subject, sender=row.sender, recipients=json.loads(row.recipients),
+                              body=row.body, html=row.html)
+                try:
+                    conn.send(msg)
+                    results[row.id] = {'state': 'sent', 'last_error': None, 'sent_at': datetime.utcnow()}
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except Exception as e:
+                    # Rejected recipient, bad header, ...: only this message is retried
+                    results[row.id] = _mail_failed(row, e)
+    except Exception as e:
+        # Connection-level failure: everything not yet sent goes back with backoff
+        print(f"[WARN] SMTP connection failed: {e}")
+        for row in claimed:
+            results.setdefault(row.id, _mail_failed(row, e))
+    for row in claimed:
+        MailOutbox.query.filter_by(id=row.id).update(results[row.id], synchronize_session=False)
+    db.session.commit()
+    return len(claimed)
+
+def _mail_outbox_loop():
+    while True:
+        _mail_outbox_wakeup.wait(MAIL_OUTBOX_POLL_SECS)
+        _mail_outbox_wakeup.clear()
+        try:
+            with app.app_context():
+                while _process_mail_outbox() >= MAIL_OUTBOX_BATCH:
+                    pass
+        except Exception as e:
+            print(f"[WARN] Mail outbox worker error: {e}")
+
+@app.before_request
+def _ensure_mail_outbox_worker():
+    # One worker (and so at most one SMTP connection) per process; started lazily so
+    # scripts that import app do not spawn it
+    global _mail_outbox_thread
+    if _mail_outbox_thread is not None:
+        return
+    with _mail_outbox_lock:
+        if _mail_outbox_thread is None:
+            _mail_outbox_thread = threading.Thread(target=_mail_outbox_loop, name='mail-outbox', daemon=True)
+            _mail_outbox_thread.start()
+
+def _wake_mail_outbox_worker():
+    _ensure_mail_outbox_worker()
+    _mail_outbox_wakeup.set()
 
 # Routes
 @app.get('/')
@@ -859,12 +1881,9 @@ def register():
     })
 
 # Carousel Management Endpoints
-@app.get('/carousel/slides')
-def get_carousel_slides():
-    """Get all active carousel slides"""
+def _active_carousel_slides() -> list:
     slides = CarouselSlide.query.filter_by(is_active=True).order_by(CarouselSlide.sort_order.asc()).all()
-    
-    return jsonify([{
+    return [{
         'id': slide.id,
         'title': slide.title,
         'description': slide.description,
@@ -874,7 +1893,13 @@ def get_carousel_slides():
         'sort_order': slide.sort_order,
         'created_at': slide.created_at.isoformat() if slide.created_at else None,
         'updated_at': slide.updated_at.isoformat() if slide.updated_at else None
-    } for slide in slides])
+    } for slide in slides]
+
+@app.get('/carousel/slides')
+@_conditional_get(_carousel_watermark)
+def get_carousel_slides():
+    """Get all active carousel slides"""
+    return jsonify(_active_carousel_slides())
 
 @app.get('/admin/carousel/slides')
 def admin_get_carousel_slides():
@@ -926,6 +1951,7 @@ def admin_create_carousel_slide():
         
         db.session.add(slide)
         db.session.commit()
+        _carousel_changed()
         
         return jsonify({
             'id': slide.id,
@@ -972,6 +1998,7 @@ def admin_update_carousel_slide(slide_id):
     
     try:
         db.session.commit()
+        _carousel_changed()
         
         return jsonify({
             'id': slide.id,
@@ -1001,6 +2028,7 @@ def admin_delete_carousel_slide(slide_id):
     try:
         db.session.delete(slide)
         db.session.commit()
+        _carousel_changed()
         
         return jsonify({'message': 'Carousel slide deleted successfully'})
         
@@ -1068,13 +2096,7 @@ def vendor_apply():
     
     # Enforce admin settings for required documents and email verification
     try:
-        from pathlib import Path
-        instance_dir = Path(app.instance_path)
-        settings_path = instance_dir / 'admin_settings.json'
-        settings = {}
-        if settings_path.exists():
-            with settings_path.open('r', encoding='utf-8') as f:
-                settings = json.load(f)
+        settings = _load_admin_settings()
         require_email = bool(((settings.get('vendor') or {}).get('requireEmailVerification')))
         require_license = bool(((settings.get('vendor') or {}).get('requireLicense')))
         require_id = bool(((settings.get('vendor') or {}).get('requireId')))
@@ -1121,14 +2143,120 @@ def vendor_apply():
         'submitted_at': application.submitted_at.isoformat()
     })
 
+# ----------------------
+# Product rating aggregates
+# ----------------------
+
+_RATING_COLUMNS = ('rating_sum', 'rating_count', 'count_1', 'count_2', 'count_3', 'count_4', 'count_5')
+
+def _rating_add(product_id: int, rating: int):
+    """Fold one new review into product_rating.
+
+    Call after the review has been flushed, in the same transaction, so the aggregate
+    commits or rolls back together with it.
+    """
+    bucket = getattr(ProductRating, f'count_{rating}')
+    deltas = {
+        ProductRating.rating_sum: ProductRating.rating_sum + rating,
+        ProductRating.rating_count: ProductRating.rating_count + 1,
+        bucket: bucket + 1,
+        ProductRating.updated_at: datetime.utcnow(),
+    }
+    key = ProductRating.query.filter_by(product_id=product_id)
+    if key.update(deltas, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            # First aggregate for this product: seed from its reviews (which include the new one)
+            # so products reviewed before product_rating existed stay correct
+            db.session.add(_rating_from_reviews([product_id])[product_id])
+    except IntegrityError:
+        # Another worker created the row first; increment it instead
+        key.update(deltas, synchronize_session=False)
+
+def _rating_from_reviews(product_ids) -> dict:
+    """Aggregate reviews with one GROUP BY; returns {product_id: unsaved ProductRating}."""
+    query = db.session.query(Review.product_id, Review.rating, db.func.count(Review.id))
+    if product_ids is not None:
+        query = query.filter(Review.product_id.in_(list(product_ids)))
+    out = {}
+    for pid, rating, n in query.group_by(Review.product_id, Review.rating).all():
+        row = out.setdefault(pid, ProductRating(product_id=pid, rating_sum=0, rating_count=0,
+                                                count_1=0, count_2=0, count_3=0, count_4=0, count_5=0))
+        if rating in (1, 2, 3, 4, 5):
+            setattr(row, f'count_{rating}', getattr(row, f'count_{rating}') + n)
+        row.rating_sum += (rating or 0) * n
+        row.rating_count += n
+    return out
+
+def _product_ratings(product_ids) -> dict:
+    """{product_id: ProductRating} for the given ids in one query; products without reviews are absent."""
+    ids = list({pid for pid in product_ids if pid})
+    if not ids:
+        return {}
+    return {r.product_id: r for r in ProductRating.query.filter(ProductRating.product_id.in_(ids)).all()}
+
+def _rating_summary(agg) -> dict:
+    count = (agg.rating_count or 0) if agg else 0
+    return {
+        'rating': round((agg.rating_sum or 0) / count, 1) if count else 0,
+        'rating_count': count,
+    }
+
+def _rating_histogram(agg) -> dict:
+    return {str(i): (getattr(agg, f'count_{i}') or 0) if agg else 0 for i in range(1, 6)}
+
+def _ratings_rebuild(product_id: int = None) -> int:
+    """Recompute product_rating from the review table (all products, or one). Commits."""
+    query = ProductRating.query
+    if product_id is not None:
+        query = query.filter_by(product_id=product_id)
+    query.delete(synchronize_session=False)
+    rows = _rating_from_reviews([product_id] if product_id is not None else None)
+    db.session.add_all(rows.values())
+    db.session.commit()
+    _catalog_changed()
+    return len(rows)
+
+def _product_list_item(p, ratings: dict = None):
+    """Compact product shape shared by the catalog list endpoints."""
+    item = {
+        'id': p.id,
+        'name': p.name,
+        'description': p.description[:100] + '...' if p.description and len(p.description) > 100 else p.description,
+        'price': p.price,
+        'category': p.category,
+        'vendor_id': p.vendor_id,
+        'image_url': p.image_url,
+        'stock_quantity': p.stock_quantity,
+        'created_at': p.created_at.isoformat() if p.created_at else None
+    }
+    if ratings is not None:
+        item.update(_rating_summary(ratings.get(p.id)))
+    return item
+
+def _product_list_items(products) -> list:
+    """Serialize a page of products, attaching rating aggregates with a single lookup."""
+    ratings = _product_ratings(p.id for p in products)
+    return [_product_list_item(p, ratings) for p in products]
+
 @app.get('/products')
+@_conditional_get(_catalog_watermark)
 def get_products():
+    """List products, newest first.
+
+    Two paging modes:
+    - cursor mode (any ?cursor= param, empty for the first page): returns
+      {items, next_cursor, has_more}; ?limit= sets the page size (default 20, max 100).
+    - legacy mode: ?page=&per_page= or a plain ?limit=, returning a bare list.
+    """
     # Get query parameters for pagination and filtering
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     category = request.args.get('category', '')
     vendor_id = request.args.get('vendor_id', type=int)
     limit = request.args.get('limit', type=int)
+    cursor_mode = 'cursor' in request.args
     
     # Build query
     query = Product.query
@@ -1140,9 +2268,36 @@ def get_products():
     # Filter by vendor_id if provided (for vendor dashboard)
     if vendor_id:
         query = query.filter(Product.vendor_id == vendor_id)
+
+    # Facet filters (same semantics as /products/facets)
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if (request.args.get('in_stock') or '').lower() in ('1', 'true', 'yes', 'on'):
+        query = query.filter(Product.stock_quantity > 0)
+
+    if cursor_mode:
+        try:
+            page_size, cursor_values = _page_args(default_limit=20, max_limit=100)
+            if cursor_values:
+                query = query.filter(_keyset_after(Product.created_at, Product.id, cursor_values))
+        except (ValueError, TypeError, IndexError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Fetch one extra row to learn whether another page exists (no COUNT needed)
+        rows = query.order_by(Product.created_at.desc(), Product.id.desc()).limit(page_size + 1).all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        resp = jsonify({'items': _product_list_items(rows), 'next_cursor': next_cursor, 'has_more': has_more})
+        if next_cursor:
+            resp.headers['X-Next-Cursor'] = next_cursor
+        return resp
     
     # Order by newest first
-    query = query.order_by(Product.created_at.desc())
+    query = query.order_by(Product.created_at.desc(), Product.id.desc())
     
     # Apply pagination or limit
     if limit:
@@ -1151,40 +2306,270 @@ def get_products():
         products = query.paginate(
             page=page, 
             per_page=per_page, 
-            error_out=False
+            error_out=False,
+            count=False
         ).items
     
     # Optimize response - only include essential fields for list view
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'description': p.description[:100] + '...' if p.description and len(p.description) > 100 else p.description,
-        'price': p.price,
-        'category': p.category,
-        'vendor_id': p.vendor_id,
-        'image_url': p.image_url,
-        'stock_quantity': p.stock_quantity,
-        'created_at': p.created_at.isoformat() if p.created_at else None
-    } for p in products])
+    return jsonify(_product_list_items(products))
+
+# ----------------------
+# Product search index (Postgres tsvector GIN / SQLite FTS5)
+# ----------------------
+# Postgres indexes the expression below; SQLite keeps an external-content FTS5 table
+# in sync through triggers, so every write path (create/update/delete, scripts) is covered.
+# Both are created by add_indexes.py (Postgres with CREATE INDEX CONCURRENTLY, so product
+# writes are not blocked); until then search falls back to LIKE.
+_PG_PRODUCT_TSV = (
+    "(setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(category, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'C'))"
+)
+_SQLITE_PRODUCT_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(name, description, category, content='product', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN "
+    "INSERT INTO product_fts(rowid, name, description, category) VALUES (new.id, new.name, new.description, new.category); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name, description, category) VALUES ('delete', old.id, old.name, old.description, old.category); END",
+    "CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description, category ON product BEGIN "
+    "INSERT INTO product_fts(product_fts, rowid, name, description, category) VALUES ('delete', old.id, old.name, old.description, old.category); "
+    "INSERT INTO product_fts(rowid, name, description, category) VALUES (new.id, new.name, new.description, new.category); END",
+]
+SEARCH_INDEX_RECHECK_SECS = 300  # how often a worker without the index looks for it again
+_search_index_state = {'ready': None, 'checked': 0.0}
+_search_index_lock = threading.Lock()
+
+def _search_index_ready() -> bool:
+    """Whether the text index exists (it is built by add_indexes.py). False means LIKE search.
+
+    A positive answer is kept for the life of the process; a negative one is rechecked
+    every SEARCH_INDEX_RECHECK_SECS so workers pick up an index built after they started.
+    """
+    state = _search_index_state
+    if state['ready'] or (state['ready'] is False and time.monotonic() - state['checked'] < SEARCH_INDEX_RECHECK_SECS):
+        return state['ready']
+    with _search_index_lock:
+        ready = False
+        try:
+            with db.engine.connect() as conn:
+                if db.engine.name == 'postgresql':
+                    # A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind; ignore it
+                    ready = bool(conn.execute(text(
+                        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('idx_product_fts')"
+                    )).scalar())
+                elif db.engine.name == 'sqlite':
+                    ready = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'product_fts'")).first() is not None
+        except Exception as e:
+            print(f"[WARN] Could not check the product search index, using LIKE search: {e}")
+        state['ready'], state['checked'] = ready, time.monotonic()
+        return ready
+
+def _search_tokens(q: str) -> list:
+    return re.findall(r'\w+', (q or '').lower())[:8]
+
+@app.get('/products/search')
+def search_products():
+    """Ranked product search over name, category and description.
+
+    Query params: q (required), category and vendor_id (optional exact filters),
+    limit (default 20, max 100), offset. Each search term matches as a prefix.
+    """
+    try:
+        q = (request.args.get('q') or '').strip()
+        category = (request.args.get('category') or '').strip()
+        vendor_id = request.args.get('vendor_id', type=int)
+        limit = max(1, min(request.args.get('limit', 20, type=int) or 20, 100))
+        offset = max(0, request.args.get('offset', 0, type=int) or 0)
+        tokens = _search_tokens(q)
+        if not tokens:
+            return jsonify({'items': [], 'query': q, 'has_more': False})
+
+        indexed = _search_index_ready()
+        if indexed and db.engine.name == 'sqlite':
+            filters = ''
+            params = {'match': ' '.join(f'"{t}"*' for t in tokens), 'limit': limit + 1, 'offset': offset}
+            if category:
+                filters += ' AND lower(product.category) = :category'
+                params['category'] = category.lower()
+            if vendor_id:
+                filters += ' AND product.vendor_id = :vendor_id'
+                params['vendor_id'] = vendor_id
+            ids = [row[0] for row in db.session.execute(text(
+                'SELECT product.id FROM product_fts JOIN product ON product.id = product_fts.rowid '
+                f'WHERE product_fts MATCH :match{filters} '
+                'ORDER BY bm25(product_fts, 10.0, 2.0, 5.0), product.id DESC LIMIT :limit OFFSET :offset'
+            ), params).fetchall()]
+            by_id = {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()} if ids else {}
+            rows = [by_id[i] for i in ids if i in by_id]
+        else:
+            query = Product.query
+            if category:
+                query = query.filter(db.func.lower(Product.category) == category.lower())
+            if vendor_id:
+                query = query.filter(Product.vendor_id == vendor_id)
+            if indexed:
+                tsquery = ' & '.join(f'{t}:*' for t in tokens)
+                query = query.filter(text(f"{_PG_PRODUCT_TSV} @@ to_tsquery('simple', :tsq)")).order_by(
+                    text(f"ts_rank({_PG_PRODUCT_TSV}, to_tsquery('simple', :tsq)) DESC"), Product.id.desc()
+                ).params(tsq=tsquery)
+            else:
+                for t in tokens:
+                    like = f'%{t}%'
+                    query = query.filter(db.or_(Product.name.ilike(like), Product.description.ilike(like), Product.category.ilike(like)))
+                query = query.order_by(Product.name.ilike(f'%{tokens[0]}%').desc(), Product.created_at.desc())
+            rows = query.offset(offset).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        return jsonify({'items': _product_list_items(rows[:limit]), 'query': q, 'has_more': has_more})
+    except Exception as e:
+        return jsonify({'error': f'Search failed: {e}'}), 500
+
+# ----------------------
+# Catalog facets (in-memory facet index per worker)
+# ----------------------
+# The index holds one compact tuple per product and is rebuilt with a single query
+# whenever the catalog generation marker changes (any worker wrote products or stock) or
+# after FACET_INDEX_MAX_AGE seconds as a safety net for out-of-band writes.
+FACET_INDEX_MAX_AGE = float(os.getenv('FACET_INDEX_MAX_AGE', '300'))
+FACET_PRICE_EDGES = [0, 100, 500, 1000, 5000]
+_facet_index = {'gen': None, 'built_at': 0.0, 'rows': [], 'vendor_names': {}}
+_facet_index_lock = threading.Lock()
+
+def _facet_rows():
+    """Return (rows, vendor_names); rows are (id, category, price, vendor_id, in_stock)."""
+    gen = _catalog_generation()
+    now = time.monotonic()
+    with _facet_index_lock:
+        if _facet_index['built_at'] and _facet_index['gen'] == gen and now - _facet_index['built_at'] < FACET_INDEX_MAX_AGE:
+            return _facet_index['rows'], _facet_index['vendor_names']
+    result = db.session.query(
+        Product.id, Product.category, Product.price, Product.vendor_id, Product.stock_quantity, User.name
+    ).outerjoin(User, Product.vendor_id == User.id).all()
+    rows = []
+    vendor_names = {}
+    for pid, category, price, vendor_id, stock, vendor_name in result:
+        rows.append((pid, category or 'Uncategorized', float(price or 0.0), vendor_id or 0, (stock or 0) > 0))
+        vendor_names[vendor_id or 0] = vendor_name or f'Vendor {vendor_id or 0}'
+    with _facet_index_lock:
+        _facet_index.update({'gen': gen, 'built_at': now, 'rows': rows, 'vendor_names': vendor_names})
+    return rows, vendor_names
+
+def _price_bucket(price: float) -> int:
+    idx = 0
+    for i, edge in enumerate(FACET_PRICE_EDGES):
+        if price >= edge:
+            idx = i
+    return idx
+
+def _price_bucket_label(idx: int) -> dict:
+    lo = FACET_PRICE_EDGES[idx]
+    hi = FACET_PRICE_EDGES[idx + 1] if idx + 1 < len(FACET_PRICE_EDGES) else None
+    return {'min': lo, 'max': hi, 'label': f'{lo}-{hi}' if hi is not None else f'{lo}+'}
+
+@app.get('/products/facets')
+def get_product_facets():
+    """Facet counts for the current filter set.
+
+    Query params (all optional): category, vendor_id, min_price, max_price, in_stock=1.
+    Each facet is counted with every filter applied except its own, so the UI can
+    offer the alternative values; 'total' applies all filters.
+    """
+    try:
+        category = (request.args.get('category') or '').strip().lower()
+        vendor_id = request.args.get('vendor_id', type=int)
+        min_price = request.args.get('min_price', type=float)
+        max_price = request.args.get('max_price', type=float)
+        in_stock = (request.args.get('in_stock') or '').lower() in ('1', 'true', 'yes', 'on')
+
+        rows, vendor_names = _facet_rows()
+        categories, buckets, vendors = {}, {}, {}
+        total = 0
+        stocked = 0
+        for _pid, cat, price, vid, has_stock in rows:
+            ok_cat = not category or cat.lower() == category
+            ok_vendor = not vendor_id or vid == vendor_id
+            ok_price = (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+            ok_stock = not in_stock or has_stock
+            if ok_vendor and ok_price and ok_stock:
+                categories[cat] = categories.get(cat, 0) + 1
+            if ok_cat and ok_vendor and ok_stock:
+                b = _price_bucket(price)
+                buckets[b] = buckets.get(b, 0) + 1
+            if ok_cat and ok_price and ok_stock:
+                vendors[vid] = vendors.get(vid, 0) + 1
+            if ok_cat and ok_vendor and ok_price:
+                if has_stock:
+                    stocked += 1
+                if ok_stock:
+                    total += 1
+
+        return jsonify({
+            'total': total,
+            'categories': [{'value': c, 'count': n} for c, n in sorted(categories.items(), key=lambda kv: (-kv[1], kv[0]))],
+            'price_buckets': [dict(_price_bucket_label(i), count=buckets.get(i, 0)) for i in range(len(FACET_PRICE_EDGES))],
+            'vendors': [{'vendor_id': v, 'vendor_name': vendor_names.get(v, f'Vendor {v}'), 'count': n} for v, n in sorted(vendors.items(), key=lambda kv: (-kv[1], kv[0]))],
+            'in_stock': stocked,
+        })
+    except Exception as e:
+        return jsonify({'error': f'Failed to load facets: {e}'}), 500
 
 @app.get('/products/featured')
+@_conditional_get(_catalog_watermark)
 def get_featured_products():
     """Get featured products (newest 8 products)"""
-    products = Product.query.order_by(Product.created_at.desc()).limit(8).all()
+    products = Product.query.order_by(Product.created_at.desc(), Product.id.desc()).limit(8).all()
     
-    return jsonify([{
-        'id': p.id,
-        'name': p.name,
-        'description': p.description[:100] + '...' if p.description and len(p.description) > 100 else p.description,
-        'price': p.price,
-        'category': p.category,
-        'vendor_id': p.vendor_id,
-        'image_url': p.image_url,
-        'stock_quantity': p.stock_quantity,
-        'created_at': p.created_at.isoformat() if p.created_at else None
-    } for p in products])
+    return jsonify(_product_list_items(products))
+
+# ----------------------
+# Storefront home bundle
+# ----------------------
+# One response for Home.vue: newest products, active carousel slides and categories.
+# The serialized body is cached per worker together with the generation markers it was
+# built from (catalog, carousel, categories file); a steady-state hit costs three stat()
+# calls and no database work. Writers (including stock changes) bump the markers, and
+# HOME_CACHE_TTL bounds staleness for changes made outside the app (scripts, direct SQL).
+# The ETag is the hash of the cached body, so a rebuilt body always gets a new ETag.
+HOME_CACHE_TTL = float(os.getenv('HOME_CACHE_TTL', '60'))
+HOME_FEATURED_LIMIT = int(os.getenv('HOME_FEATURED_LIMIT', '24'))
+
+def _home_generations():
+    return (_catalog_generation(), _generation('carousel'), settings_cache.signature(_admin_categories_path()))
+
+def _home_entry() -> tuple:
+    """(body bytes, body digest) for /home, rebuilt when a generation marker moves."""
+    gens = _home_generations()
+
+    def load():
+        products = Product.query.order_by(Product.created_at.desc(), Product.id.desc()).limit(HOME_FEATURED_LIMIT).all()
+        payload = {
+            'featured': _product_list_items(products),
+            'slides': _active_carousel_slides(),
+            'categories': _load_admin_categories(),
+        }
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return gens, body, hashlib.sha1(body).hexdigest()
+
+    built_from, body, digest = _cached(('home',), HOME_CACHE_TTL, load)
+    if built_from != gens:
+        _cache_invalidate('home')
+        built_from, body, digest = _cached(('home',), HOME_CACHE_TTL, load)
+    return body, digest
+
+def _home_watermark(**_kwargs):
+    return _home_entry()[1], None
+
+@app.get('/home')
+@_conditional_get(_home_watermark)
+def get_home():
+    """Storefront bundle: {featured, slides, categories}"""
+    try:
+        return app.response_class(_home_entry()[0], mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': f'Failed to load home: {e}'}), 500
 
 @app.get('/products/<int:product_id>')
+@_conditional_get(_product_watermark)
 def get_product(product_id):
     """Get a single product by ID"""
     product = Product.query.get(product_id)
@@ -1211,11 +2596,12 @@ def get_product(product_id):
     except:
         sizes = []
     
-    # Calculate average rating from reviews
-    reviews = Review.query.filter_by(product_id=product_id).all()
-    avg_rating = 0
-    if reviews:
-        avg_rating = sum(review.rating for review in reviews) / len(reviews)
+    # Rating aggregates are maintained by create_review(); fall back to one GROUP BY
+    # for products reviewed before product_rating was populated
+    agg = db.session.get(ProductRating, product_id)
+    if agg is None:
+        agg = _rating_from_reviews([product_id]).get(product_id)
+    rating = _rating_summary(agg)
     
     return jsonify({
         'id': product.id,
@@ -1233,7 +2619,9 @@ def get_product(product_id):
         'sizes': sizes,
         'brand': getattr(product, 'brand', None),
         'made': getattr(product, 'made', None),
-        'rating': round(avg_rating, 1),
+        'rating': rating['rating'],
+        'rating_count': rating['rating_count'],
+        'rating_histogram': _rating_histogram(agg),
         'is_featured': getattr(product, 'is_featured', False) or False,
         'created_at': product.created_at.isoformat() if product.created_at else None,
         'updated_at': product.updated_at.isoformat() if product.updated_at else None
@@ -1304,6 +2692,7 @@ def create_product():
     
     db.session.add(product)
     db.session.commit()
+    _catalog_changed()
     
     print(f"[DEBUG] Created product '{name}' for vendor {vendor_id}")
     
@@ -1344,8 +2733,10 @@ def delete_product(product_id):
         return jsonify({'error': 'Cannot delete product with existing orders. Use force=true to override.'}), 400
     
     # Delete the product
+    ProductRating.query.filter_by(product_id=product_id).delete(synchronize_session=False)
     db.session.delete(product)
     db.session.commit()
+    _catalog_changed()
     
     print(f"[DEBUG] Deleted product {product_id} (vendor_id: {product.vendor_id})")
     
@@ -1391,6 +2782,7 @@ def update_product(product_id):
     
     product.updated_at = datetime.utcnow()
     db.session.commit()
+    _catalog_changed()
     
     print(f"[DEBUG] Updated product {product_id} (vendor_id: {product.vendor_id})")
     
@@ -1411,10 +2803,54 @@ def update_product(product_id):
 # Review Endpoints
 @app.get('/products/<int:product_id>/reviews')
 def get_product_reviews(product_id):
-    """Get all reviews for a product"""
-    reviews = Review.query.filter_by(product_id=product_id).order_by(Review.created_at.desc()).all()
-    
-    return jsonify([{
+    """Get a page of reviews for a product.
+
+    Query params: sort (newest | highest | lowest, default newest), rating (1-5 filter),
+    limit (default 20, max 100), cursor (from the X-Next-Cursor response header).
+    The body stays a plain list; X-Next-Cursor is only set when more reviews exist.
+    """
+    sort = (request.args.get('sort') or 'newest').lower()
+    if sort not in ('newest', 'highest', 'lowest'):
+        return jsonify({'error': 'sort must be one of newest, highest, lowest'}), 400
+    rating = request.args.get('rating', type=int)
+    if rating is not None and not 1 <= rating <= 5:
+        return jsonify({'error': 'Rating must be between 1 and 5'}), 400
+
+    # Reviewer names come from the same query instead of one lazy User load per review
+    q = db.session.query(Review, User.first_name, User.last_name).outerjoin(
+        User, Review.user_id == User.id
+    ).filter(Review.product_id == product_id)
+    if rating is not None:
+        q = q.filter(Review.rating == rating)
+    try:
+        limit, cursor_values = _page_args(default_limit=20, max_limit=100)
+        if cursor_values:
+            if sort == 'newest':
+                if len(cursor_values) != 2:
+                    raise ValueError('Invalid cursor')
+                q = q.filter(_keyset_after(Review.created_at, Review.id, cursor_values))
+            else:
+                if len(cursor_values) != 3:
+                    raise ValueError('Invalid cursor')
+                last_rating = int(cursor_values[0])
+                beyond = Review.rating < last_rating if sort == 'highest' else Review.rating > last_rating
+                q = q.filter(db.or_(beyond, db.and_(
+                    Review.rating == last_rating,
+                    _keyset_after(Review.created_at, Review.id, cursor_values[1:])
+                )))
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    order = [Review.created_at.desc(), Review.id.desc()]
+    if sort == 'highest':
+        order.insert(0, Review.rating.desc())
+    elif sort == 'lowest':
+        order.insert(0, Review.rating.asc())
+    rows = q.order_by(*order).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    resp = jsonify([{
         'id': review.id,
         'product_id': review.product_id,
         'user_id': review.user_id,
@@ -1422,8 +2858,13 @@ def get_product_reviews(product_id):
         'comment': review.comment if review.comment and review.comment.strip() else None,
         'photos': json.loads(review.photos) if review.photos else [],
         'created_at': review.created_at.isoformat() if review.created_at else None,
-        'reviewer_name': f"{review.user.first_name} {review.user.last_name}" if review.user else "Anonymous"
-    } for review in reviews])
+        'reviewer_name': f"{first_name} {last_name}" if first_name is not None else "Anonymous"
+    } for review, first_name, last_name in rows])
+    if has_more and rows:
+        last = rows[-1][0]
+        keys = (last.created_at, last.id) if sort == 'newest' else (last.rating, last.created_at, last.id)
+        resp.headers['X-Next-Cursor'] = _encode_cursor(*keys)
+    return resp
 
 @app.post('/products/<int:product_id>/reviews')
 def create_review(product_id):
@@ -1466,7 +2907,10 @@ def create_review(product_id):
     )
     
     db.session.add(review)
+    db.session.flush()
+    _rating_add(product_id, rating)
     db.session.commit()
+    _catalog_changed()
     
     return jsonify({
         'id': review.id,
@@ -1773,6 +3217,14 @@ def process_refund(refund_id):
         'payment_reference': refund.payment_reference
     })
 
+def _fail_checkout_orders(orders: list):
+    """No payment can follow a failed gateway init: fail the committed orders and give their stock back."""
+    for o in orders:
+        o.payment_status = 'failed'
+        o.updated_at = datetime.utcnow()
+    _release_stock([o.id for o in orders])
+    db.session.commit()
+
 @app.post('/payments/checkout')
 def checkout():
     """Initialize payment checkout with vendor split support.
@@ -1798,34 +3250,8 @@ def checkout():
             error_msg = f'user_id and items are required, got user_id: {user_id}, items: {items}'
             return jsonify({'error': error_msg}), 400
         
-        # Group items by vendor
-        def _get_pid(it):
-            try:
-                return (
-                    it.get('product_id') or it.get('productId') or it.get('id') or
-                    ((it.get('product') or {}).get('id'))
-                )
-            except Exception:
-                return None
-
-        vendor_to_lines = {}
-        total_amount = 0.0
-        for item in items:
-            pid = _get_pid(item)
-            qty = int(item.get('quantity') or 0)
-            if not pid or qty <= 0:
-                if DEBUG:
-                    print(f"[CHECKOUT] Skipping invalid item: {item}")
-                continue
-            product = Product.query.get(pid)
-            if not product:
-                if DEBUG:
-                    print(f"[CHECKOUT] Product not found: {pid}")
-                continue
-            line_total = product.price * qty
-            total_amount += line_total
-            vid = product.vendor_id or 0
-            vendor_to_lines.setdefault(vid, []).append((product, qty))
+        # Group items by vendor (one batched product lookup for the whole cart)
+        vendor_to_lines, total_amount = _resolve_cart_lines(items)
 
         if not vendor_to_lines:
             return jsonify({'error': 'No valid products found for checkout'}), 400
@@ -1854,21 +3280,26 @@ def checkout():
                 db.session.flush()
                 for p, qty in lines:
                     db.session.add(OrderItem(order_id=order.id, product_id=p.id, quantity=qty, price=p.price))
-                tx_ref = f"order_{order.id}_{uuid.uuid4().hex[:8]}"
+                created_orders.append((order, lines))
+            # Hold stock for the whole cart and commit before talking to the gateway, so the
+            # product rows are not kept locked across the gateway round trips
+            _reserve_stock(created_orders)
+            for order, lines in created_orders:
                 order.payment_method = 'chapa'
-                order.payment_reference = tx_ref
-                created_orders.append(order)
+                order.payment_reference = f"order_{order.id}_{uuid.uuid4().hex[:8]}"
+            db.session.commit()
+            orders = [order for order, _lines in created_orders]
+            for order in orders:
                 # Create a chapa session per order
-                resp = initiate_chapa_payment(order_total, currency, customer, tx_ref)
+                resp = initiate_chapa_payment(order.total_amount, currency, customer, order.payment_reference)
                 if (resp.get('status') != 'success'):
-                    db.session.rollback()
+                    _fail_checkout_orders(orders)
                     return jsonify({'error': 'Failed to initialize vendor payment', 'details': resp}), 502
                 sessions.append({
                     'order_id': order.id,
-                    'tx_ref': tx_ref,
+                    'tx_ref': order.payment_reference,
                     'checkout_url': ((resp.get('data') or {}).get('checkout_url')) or ''
                 })
-            db.session.commit()
             return jsonify({ 'mode': 'per_vendor', 'sessions': sessions, 'currency': currency })
         else:
             # Single payment for all vendors: attempt ParentOrder linkage; if DB lacks column, fall back automatically
@@ -1944,6 +3375,9 @@ def checkout():
                         db.session.add(OrderItem(order_id=order.id, product_id=p.id, quantity=qty, price=p.price))
                     child_orders.append(order)
 
+            # Hold stock for the whole cart in the same transaction as the orders
+            _reserve_stock(list(zip(child_orders, vendor_to_lines.values())))
+
             tx_prefix = f"parent_{parent.id}" if parent is not None else f"batch_{uuid.uuid4().hex[:4]}"
             tx_ref = f"{tx_prefix}_{uuid.uuid4().hex[:8]}"
             if parent is not None:
@@ -1955,11 +3389,16 @@ def checkout():
 
             resp = initiate_chapa_payment(total_amount, currency, customer, tx_ref)
             if (resp.get('status') != 'success'):
+                _fail_checkout_orders(child_orders)
                 return jsonify({'error': 'Failed to initialize payment', 'details': resp}), 502
             checkout_url = ((resp.get('data') or {}).get('checkout_url')) or ''
             if not checkout_url:
+                _fail_checkout_orders(child_orders)
                 return jsonify({'error': 'Checkout URL not returned by gateway'}), 502
             return jsonify({ 'mode': 'single', 'parent_order_id': (parent.id if parent is not None else None), 'order_ids': [o.id for o in child_orders], 'tx_ref': tx_ref, 'checkout_url': checkout_url, 'total_amount': total_amount, 'currency': currency })
+    except InsufficientStock as e:
+        db.session.rollback()
+        return _insufficient_stock_response(e)
     except Exception as e:
         db.session.rollback()
         err = f"{e}"
@@ -1992,22 +3431,8 @@ def place_order_pending():
         if not user_id or not items:
             return jsonify({'error': 'user_id and items are required'}), 400
 
-        # Group items by vendor
-        def _get_pid(it):
-            try:
-                return it.get('product_id') or it.get('productId') or it.get('id') or ((it.get('product') or {}).get('id'))
-            except Exception:
-                return None
-        vendor_to_lines = {}
-        for it in items:
-            pid = _get_pid(it)
-            qty = int(it.get('quantity') or 0)
-            if not pid or qty <= 0:
-                continue
-            p = Product.query.get(pid)
-            if not p:
-                continue
-            vendor_to_lines.setdefault(p.vendor_id or 0, []).append((p, qty))
+        # Group items by vendor (one batched product lookup for the whole cart)
+        vendor_to_lines, _ = _resolve_cart_lines(items)
 
         if not vendor_to_lines:
             return jsonify({'error': 'No valid products'}), 400
@@ -2027,39 +3452,23 @@ def place_order_pending():
             for p, qty in lines:
                 db.session.add(OrderItem(order_id=order.id, product_id=p.id, quantity=qty, price=p.price))
             created.append(order)
+        _reserve_stock(list(zip(created, vendor_to_lines.values())))
         db.session.commit()
 
-        # Notify vendors and admin (best-effort)
+        # Notify vendors and admin (best-effort): one email per vendor, one enqueue
         try:
-            for o in created:
-                first_item = OrderItem.query.filter_by(order_id=o.id).first()
-                if first_item:
-                    product = Product.query.get(first_item.product_id)
-                    vendor = User.query.get(product.vendor_id) if product else None
-                    if vendor and vendor.email:
-                        msg = Message(
-                            subject='New Order Placed',
-                            sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                            recipients=[vendor.email],
-                            body=f'Order #{o.id} has been placed and is pending payment. Please prepare for fulfillment.'
-                        )
-                        send_mail_background(msg)
-            if ADMIN_EMAIL:
-                msg = Message(
-                    subject='New Pending Order(s)',
-                    sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                    recipients=[ADMIN_EMAIL],
-                    body=f'{len(created)} pending order(s) created.'
-                )
-                send_mail_background(msg)
-        except Exception:
-            pass
+            enqueue_mail(_order_notifications('placed', created, admin_body=f'{len(created)} pending order(s) created.'))
+        except Exception as e:
+            print(f"[WARN] Could not queue order notifications: {e}")
 
         return jsonify({
             'ok': True,
             'order_ids': [o.id for o in created],
             'total_orders': len(created)
         })
+    except InsufficientStock as e:
+        db.session.rollback()
+        return _insufficient_stock_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to place order: {e}'}), 500
@@ -2181,9 +3590,183 @@ def set_order_payment_method(order_id):
         db.session.rollback()
         return jsonify({'error': f'Failed to set payment method: {e}'}), 500
 
+# ----------------------
+# Chapa payment events (webhook inbox)
+# ----------------------
+# The callback only inserts a payment_event row (one per tx_ref) and returns 200. A worker
+# thread claims due events with a conditional UPDATE, verifies them against the gateway and
+# applies the result; failures are retried with exponential backoff. Processing is
+# idempotent (paid orders exit early, stock and rollup hooks only act on transitions), so
+# a redelivered callback or a second worker claiming the same row is harmless.
+PAYMENT_EVENT_BATCH = int(os.getenv('PAYMENT_EVENT_BATCH', '20'))
+PAYMENT_EVENT_MAX_ATTEMPTS = int(os.getenv('PAYMENT_EVENT_MAX_ATTEMPTS', '8'))
+PAYMENT_EVENT_POLL_SECS = float(os.getenv('PAYMENT_EVENT_POLL_SECS', '30'))
+PAYMENT_EVENT_STALE_SECS = 300  # a 'processing' claim older than this is assumed lost
+_payment_event_wakeup = threading.Event()
+_payment_event_thread = None
+_payment_event_lock = threading.Lock()
+
+def _public_base_url() -> str:
+    """Backend origin for links in emails; also works outside a request (worker threads)."""
+    if has_request_context():
+        return request.host_url.rstrip('/')
+    parsed = urlparse(os.getenv('PUBLIC_BASE_URL') or CHAPA_CALLBACK_URL)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+def _record_payment_event(tx_ref: str, payload: dict) -> bool:
+    """Store (or re-arm) the inbox row for tx_ref and commit. Returns True if work is queued."""
+    now = datetime.utcnow()
+    try:
+        with db.session.begin_nested():
+            db.session.add(PaymentEvent(tx_ref=tx_ref, payload=json.dumps(payload, default=str)[:4000], next_attempt_at=now))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Redelivery: only re-arm events that did not end in a payment (a later callback may report success)
+        rearmed = PaymentEvent.query.filter(
+            PaymentEvent.tx_ref == tx_ref,
+            PaymentEvent.state.in_(['done', 'failed']),
+            db.or_(PaymentEvent.outcome.is_(None), PaymentEvent.outcome.notin_(['paid', 'already_paid']))
+        ).update({
+            PaymentEvent.state: 'pending', PaymentEvent.attempts: 0, PaymentEvent.next_attempt_at: now,
+            PaymentEvent.payload: json.dumps(payload, default=str)[:4000],
+        }, synchronize_session=False)
+        db.session.commit()
+        return bool(rearmed) or PaymentEvent.query.filter(PaymentEvent.tx_ref == tx_ref, PaymentEvent.state.in_(['pending', 'processing'])).count() > 0
+
+def _process_chapa_tx(tx_ref: str) -> str:
+    """Verify tx_ref with the gateway and apply it to its orders.
+
+    Returns 'paid', 'already_paid', 'not_paid' or 'not_found'; raises when the gateway
+    cannot answer so the event is retried.
+    """
+    order = Order.query.filter_by(payment_reference=tx_ref).first()
+    parent = ParentOrder.query.filter_by(tx_ref=tx_ref).first()
+    if not order and not parent:
+        return 'not_found'
+
+    # Idempotency: if already paid, exit early
+    if order and order.payment_status == 'paid':
+        return 'already_paid'
+    if parent and parent.status == 'paid':
+        return 'already_paid'
+
+    verify_resp = verify_chapa_transaction(tx_ref)
+    if verify_resp.get('error'):
+        raise RuntimeError(f"verify failed: {verify_resp['error']}")
+
+    # Expected verify success shape: { status: 'success', data: { status: 'success', ... } }
+    v_status = verify_resp.get('status')
+    v_data = verify_resp.get('data') or {}
+    paid_ok = (v_status == 'success') and ((v_data.get('status') or '').lower() == 'success')
+    if not paid_ok:
+        if order:
+            order.payment_status = 'failed'
+            order.status = 'pending'
+            order.updated_at = datetime.utcnow()
+        if parent:
+            parent.status = 'pending'
+            parent.updated_at = datetime.utcnow()
+        _release_stock(_order_ids_for_tx(tx_ref, parent))
+        db.session.commit()
+        return 'not_paid'
+
+    # Success path: mark paid
+    children = []
+    if parent:
+        parent.status = 'paid'
+        parent.updated_at = datetime.utcnow()
+        children = Order.query.filter_by(parent_order_id=parent.id).all()
+    _mark_orders_paid([ch.id for ch in children] + ([order.id] if order else []), receipt=True)
+    db.session.commit()
+
+    # Notify vendors and admin (best-effort): one email per vendor, one enqueue
+    try:
+        if parent:
+            enqueue_mail(_order_notifications('paid', children, admin_body=(
+                f'Paid order(s) under tx_ref {tx_ref}. Example invoice: '
+                f'{_public_base_url()}/orders/{(children[0].id if children else order.id)}/invoice')))
+        elif order:
+            enqueue_mail(_order_notifications('paid', [order], admin_body=(
+                f'Paid order #{order.id}. Invoice: {_public_base_url()}/orders/{order.id}/invoice')))
+    except Exception as e:
+        print(f"[WARN] Could not queue payment notifications for {tx_ref}: {e}")
+
+    return 'paid'
+
+def _claim_payment_events(limit: int) -> list:
+    now = datetime.utcnow()
+    due = db.or_(
+        db.and_(PaymentEvent.state == 'pending', PaymentEvent.next_attempt_at <= now),
+        db.and_(PaymentEvent.state == 'processing', PaymentEvent.claimed_at < now - timedelta(seconds=PAYMENT_EVENT_STALE_SECS)),
+    )
+    ids = [eid for (eid,) in db.session.query(PaymentEvent.id).filter(due).order_by(PaymentEvent.id).limit(limit).all()]
+    if not ids:
+        return []
+    claimed = db.session.execute(
+        db.update(PaymentEvent)
+        .where(PaymentEvent.id.in_(ids), due)
+        .values(state='processing', claimed_at=now, attempts=PaymentEvent.attempts + 1)
+        .returning(PaymentEvent.id, PaymentEvent.tx_ref, PaymentEvent.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return claimed
+
+def _process_payment_events(limit: int = PAYMENT_EVENT_BATCH) -> int:
+    """Process one batch of due events. Returns how many were claimed."""
+    claimed = _claim_payment_events(limit)
+    for event_id, tx_ref, attempts in claimed:
+        values = {}
+        try:
+            outcome = _process_chapa_tx(tx_ref)
+            values = {'state': 'done', 'outcome': outcome, 'last_error': None, 'processed_at': datetime.utcnow()}
+        except Exception as e:
+            db.session.rollback()
+            if attempts >= PAYMENT_EVENT_MAX_ATTEMPTS:
+                values = {'state': 'failed', 'last_error': str(e)[:500]}
+                print(f"[WARN] Payment event {tx_ref} failed after {attempts} attempt(s): {e}")
+            else:
+                delay = min(5 * (2 ** (attempts - 1)), 3600) * random.uniform(0.8, 1.2)
+                values = {'state': 'pending', 'last_error': str(e)[:500], 'next_attempt_at': datetime.utcnow() + timedelta(seconds=delay)}
+        PaymentEvent.query.filter_by(id=event_id).update(values, synchronize_session=False)
+        db.session.commit()
+    return len(claimed)
+
+def _payment_event_loop():
+    while True:
+        _payment_event_wakeup.wait(PAYMENT_EVENT_POLL_SECS)
+        _payment_event_wakeup.clear()
+        try:
+            with app.app_context():
+                while _process_payment_events() >= PAYMENT_EVENT_BATCH:
+                    pass
+        except Exception as e:
+            print(f"[WARN] Payment event worker error: {e}")
+
+@app.before_request
+def _ensure_payment_event_worker():
+    # Started lazily so scripts that import app do not spawn it; polling also picks up
+    # events left pending by a previous process
+    global _payment_event_thread
+    if _payment_event_thread is not None:
+        return
+    with _payment_event_lock:
+        if _payment_event_thread is None:
+            _payment_event_thread = threading.Thread(target=_payment_event_loop, name='payment-events', daemon=True)
+            _payment_event_thread.start()
+
+def _wake_payment_event_worker():
+    _ensure_payment_event_worker()
+    _payment_event_wakeup.set()
+
 @app.post('/payments/chapa/callback')
 def chapa_callback():
-    """Chapa server-to-server callback to confirm payment and update order."""
+    """Chapa server-to-server callback: record the event and acknowledge immediately.
+
+    The payment itself is verified and applied by the payment event worker, so the
+    gateway never waits on our verify round trip, database work or emails.
+    """
     try:
         # Basic signature verification if a webhook secret is configured.
         # Many gateways send a signature in header like 'X-Chapa-Signature'.
@@ -2199,143 +3782,15 @@ def chapa_callback():
                 return jsonify({'error': 'Signature verification failed'}), 401
 
         data = request.get_json(silent=True) or request.form.to_dict() or {}
-        tx_ref = data.get('tx_ref') or data.get('reference') or ''
-        status = data.get('status') or ''
+        tx_ref = str(data.get('tx_ref') or data.get('reference') or '').strip()
         if not tx_ref:
             return jsonify({'error': 'tx_ref is required'}), 400
 
-        order = Order.query.filter_by(payment_reference=tx_ref).first()
-        parent = ParentOrder.query.filter_by(tx_ref=tx_ref).first()
-        if not order and not parent:
-            return jsonify({'error': 'Order not found for tx_ref'}), 404
-
-        # Idempotency: if already paid, exit early
-        if order and order.payment_status == 'paid':
-            return jsonify({'ok': True, 'message': 'Already processed', 'tx_ref': tx_ref})
-        if parent and parent.status == 'paid':
-            return jsonify({'ok': True, 'message': 'Already processed', 'tx_ref': tx_ref})
-
-        verify_resp = verify_chapa_transaction(tx_ref)
-        if verify_resp.get('error'):
-            return jsonify({'error': verify_resp['error']}), 502
-
-        # Expected verify success shape: { status: 'success', data: { status: 'success', ... } }
-        v_status = verify_resp.get('status')
-        v_data = verify_resp.get('data') or {}
-        paid_ok = (v_status == 'success') and ((v_data.get('status') or '').lower() == 'success')
-        if not paid_ok:
-            if order:
-                order.payment_status = 'failed'
-                order.status = 'pending'
-                order.updated_at = datetime.utcnow()
-            if parent:
-                parent.status = 'pending'
-                parent.updated_at = datetime.utcnow()
-            db.session.commit()
-            return jsonify({'message': 'Payment not successful', 'details': verify_resp}), 400
-
-        # Success path: mark paid
-        if parent:
-            parent.status = 'paid'
-            parent.updated_at = datetime.utcnow()
-            # mark all child orders paid/confirmed
-            children = Order.query.filter_by(parent_order_id=parent.id).all()
-            for ch in children:
-                ch.status = 'completed'
-                ch.payment_status = 'paid'
-                ch.updated_at = datetime.utcnow()
-                try:
-                    ch.receipt_url = f"/orders/{ch.id}/invoice"
-                except Exception:
-                    pass
-        if order:
-            order.status = 'completed'
-            order.payment_status = 'paid'
-            order.updated_at = datetime.utcnow()
-            try:
-                order.receipt_url = f"/orders/{order.id}/invoice"
-            except Exception:
-                pass
-        db.session.commit()
-
-        # TODO: Notify vendors (email/SMS/dashboard). Stub for now.
-        try:
-            if parent:
-                children = Order.query.filter_by(parent_order_id=parent.id).all()
-                for ch in children:
-                    first_item = OrderItem.query.filter_by(order_id=ch.id).first()
-                    if not first_item:
-                        continue
-                    product = Product.query.get(first_item.product_id)
-                    vendor = User.query.get(product.vendor_id) if product else None
-                    if vendor and vendor.email:
-                        msg = Message(
-                            subject='New Order Paid',
-                            sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                            recipients=[vendor.email],
-                            body=f'Order #{ch.id} has been paid. Please fulfill.'
-                        )
-                        send_mail_background(msg)
-                        try:
-                            msg2 = Message(
-                                subject=f'Invoice for Order #{ch.id}',
-                                sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                                recipients=[vendor.email],
-                                body=f'Your order has been paid. Download the invoice: {request.host_url.rstrip("/")}/orders/{ch.id}/invoice'
-                            )
-                            send_mail_background(msg2)
-                        except Exception:
-                            pass
-                try:
-                    if ADMIN_EMAIL:
-                        msga = Message(
-                            subject='New Paid Order (Invoice)',
-                            sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                            recipients=[ADMIN_EMAIL],
-                            body=f'Paid order(s) under tx_ref {tx_ref}. Example invoice: {request.host_url.rstrip("/")}/orders/{(children[0].id if children else order.id)}/invoice'
-                        )
-                        send_mail_background(msga)
-                except Exception:
-                    pass
-            elif order:
-                first_item = OrderItem.query.filter_by(order_id=order.id).first()
-                if first_item:
-                    product = Product.query.get(first_item.product_id)
-                    vendor = User.query.get(product.vendor_id) if product else None
-                    if vendor and vendor.email:
-                        msg = Message(
-                            subject='New Order Paid',
-                            sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                            recipients=[vendor.email],
-                            body=f'Order #{order.id} has been paid. Please fulfill.'
-                        )
-                        send_mail_background(msg)
-                        try:
-                            msg2 = Message(
-                                subject=f'Invoice for Order #{order.id}',
-                                sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                                recipients=[vendor.email],
-                                body=f'Your order has been paid. Download the invoice: {request.host_url.rstrip("/")}/orders/{order.id}/invoice'
-                            )
-                            send_mail_background(msg2)
-                        except Exception:
-                            pass
-                try:
-                    if ADMIN_EMAIL:
-                        msga = Message(
-                            subject='New Paid Order (Invoice)',
-                            sender=app.config['MAIL_USERNAME'] or 'no-reply@example.com',
-                            recipients=[ADMIN_EMAIL],
-                            body=f'Paid order #{order.id}. Invoice: {request.host_url.rstrip("/")}/orders/{order.id}/invoice'
-                        )
-                        send_mail_background(msga)
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-        return jsonify({'ok': True, 'order_id': order.id if order else None, 'parent_order_id': parent.id if parent else None, 'tx_ref': tx_ref})
+        queued = _record_payment_event(tx_ref, data)
+        _wake_payment_event_worker()
+        return jsonify({'ok': True, 'tx_ref': tx_ref, 'queued': queued})
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Callback handling failed: {e}'}), 500
 
 @app.get('/api/payments/verify')
@@ -2364,18 +3819,12 @@ def api_verify_payment():
         paid_ok = (v_status == 'success') and ((v_data.get('status') or '').lower() == 'success')
 
         if paid_ok:
+            child_ids = []
             if parent:
                 parent.status = 'paid'
                 parent.updated_at = datetime.utcnow()
-                children = Order.query.filter_by(parent_order_id=parent.id).all()
-                for ch in children:
-                    ch.status = 'completed'
-                    ch.payment_status = 'paid'
-                    ch.updated_at = datetime.utcnow()
-            if order:
-                order.status = 'completed'
-                order.payment_status = 'paid'
-                order.updated_at = datetime.utcnow()
+                child_ids = [oid for (oid,) in db.session.query(Order.id).filter_by(parent_order_id=parent.id).all()]
+            _mark_orders_paid(child_ids + ([order.id] if order else []))
             db.session.commit()
         else:
             if parent:
@@ -2387,6 +3836,8 @@ def api_verify_payment():
                 order.status = 'pending'
                 order.updated_at = datetime.utcnow()
                 db.session.commit()
+            _release_stock(_order_ids_for_tx(tx_ref, parent))
+            db.session.commit()
 
         amount = None
         currency = None
@@ -2472,45 +3923,148 @@ def api_payment_status():
 # Admin: Reconcile pending Chapa payments (manual/cron)
 # ----------------------
 
+# Gateway round trips run on a bounded thread pool (HTTP only, no DB work), one per
+# distinct tx_ref since a single-mode payment covers several child orders. Paid results
+# are applied from the job thread and committed every RECONCILE_COMMIT_BATCH tx_refs.
+# Progress is written to instance/jobs/ so any worker can answer the status endpoint.
+RECONCILE_CONCURRENCY = int(os.getenv('RECONCILE_CONCURRENCY', '8'))
+RECONCILE_COMMIT_BATCH = int(os.getenv('RECONCILE_COMMIT_BATCH', '25'))
+_reconcile_running = threading.Lock()
+
+def _job_path(job_id: str) -> Path:
+    return Path(app.instance_path) / 'jobs' / f'reconcile_{job_id}.json'
+
+def _apply_reconciled(tx_refs: list, order_ids: list) -> list:
+    """Mark these orders (and parents of these tx_refs) paid; returns ids that were newly paid."""
+    if not order_ids:
+        return []
+    newly_paid = _mark_orders_paid(order_ids)
+    ParentOrder.query.filter(ParentOrder.tx_ref.in_(tx_refs), ParentOrder.status != 'paid').update(
+        {ParentOrder.status: 'paid', ParentOrder.updated_at: datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    return newly_paid
+
+def _run_reconcile(job_id: str, hours: int, limit: int) -> dict:
+    progress = {
+        'job_id': job_id, 'state': 'running', 'hours': hours, 'limit': limit,
+        'checked': 0, 'total': 0, 'tx_refs': 0, 'verified': 0, 'errors': 0, 'updated': 0, 'orders': [],
+        'started_at': datetime.utcnow().isoformat(), 'finished_at': None,
+    }
+
+    def save():
+        try:
+            settings_cache.write_json(_job_path(job_id), progress)
+        except Exception as e:
+            print(f"[WARN] Failed to save reconcile progress: {e}")
+
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        rows = db.session.query(Order.id, Order.payment_reference).filter(
+            Order.payment_method == 'chapa',
+            Order.payment_status.in_(['pending', None]),
+            Order.created_at >= cutoff,
+            Order.payment_reference.isnot(None)
+        ).order_by(Order.created_at.desc()).limit(limit).all()
+        by_tx = {}
+        for oid, ref in rows:
+            ref = (ref or '').strip()
+            if ref:
+                by_tx.setdefault(ref, []).append(oid)
+        progress.update(checked=len(rows), total=len(by_tx))
+        save()
+
+        pending_refs, pending_ids = [], []
+
+        def flush():
+            if pending_refs:
+                progress['orders'].extend(_apply_reconciled(pending_refs, pending_ids))
+                progress['updated'] = len(progress['orders'])
+                pending_refs.clear()
+                pending_ids.clear()
+
+        with ThreadPoolExecutor(max_workers=max(1, RECONCILE_CONCURRENCY), thread_name_prefix='reconcile') as pool:
+            futures = {pool.submit(verify_chapa_transaction, ref): ref for ref in by_tx}
+            for fut in as_completed(futures):
+                ref = futures[fut]
+                try:
+                    v = fut.result()
+                except Exception as e:
+                    v = {'error': str(e)}
+                progress['tx_refs'] += 1
+                if v.get('error'):
+                    progress['errors'] += 1
+                else:
+                    progress['verified'] += 1
+                    v_data = v.get('data') or {}
+                    if (v.get('status') or '').lower() == 'success' and (v_data.get('status') or '').lower() == 'success':
+                        pending_refs.append(ref)
+                        pending_ids.extend(by_tx[ref])
+                if len(pending_refs) >= RECONCILE_COMMIT_BATCH:
+                    flush()
+                    save()
+        flush()
+        progress['state'] = 'done'
+    except Exception as e:
+        db.session.rollback()
+        progress['state'] = 'failed'
+        progress['error'] = str(e)
+    progress['finished_at'] = datetime.utcnow().isoformat()
+    save()
+    return progress
+
+def _reconcile_job(job_id: str, hours: int, limit: int):
+    try:
+        with app.app_context():
+            _run_reconcile(job_id, hours, limit)
+    finally:
+        _reconcile_running.release()
+
 @app.post('/admin/payments/reconcile')
 def admin_reconcile_payments():
     """Verify recent pending Chapa orders and update their status.
 
     Query params:
       hours: how far back to look (default 24)
-      limit: max orders to process (default 50)
+      limit: max orders to process (default 50, max 500)
+      wait: 1 to run inline and return the final result (for cron callers)
+
+    By default the work runs as a background job: responds 202 with a job_id whose
+    progress is served by GET /admin/payments/reconcile/<job_id>.
     """
     try:
         hours = int(request.args.get('hours') or 24)
         limit = min(int(request.args.get('limit') or 50), 500)
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
-        candidates = Order.query.filter(
-            Order.payment_method == 'chapa',
-            Order.payment_status.in_(['pending', None]),
-            Order.created_at >= cutoff,
-            Order.payment_reference.isnot(None)
-        ).order_by(Order.created_at.desc()).limit(limit).all()
+    except ValueError:
+        return jsonify({'error': 'hours and limit must be integers'}), 400
+    wait = (request.args.get('wait') or '').lower() in ('1', 'true', 'yes', 'on')
+    if not _reconcile_running.acquire(blocking=False):
+        return jsonify({'error': 'A reconcile job is already running'}), 409
+    job_id = uuid.uuid4().hex[:12]
+    if wait:
+        try:
+            result = _run_reconcile(job_id, hours, limit)
+        finally:
+            _reconcile_running.release()
+        if result['state'] != 'done':
+            return jsonify({'error': f"Reconcile failed: {result.get('error')}", 'job_id': job_id}), 500
+        return jsonify(dict(result, ok=True))
+    try:
+        settings_cache.write_json(_job_path(job_id), {'job_id': job_id, 'state': 'queued', 'hours': hours, 'limit': limit})
+        threading.Thread(target=_reconcile_job, args=(job_id, hours, limit), name=f'reconcile-{job_id}', daemon=True).start()
+    except Exception:
+        _reconcile_running.release()
+        raise
+    return jsonify({'ok': True, 'job_id': job_id, 'state': 'queued', 'status_url': f'/admin/payments/reconcile/{job_id}'}), 202
 
-        reconciled = []
-        for o in candidates:
-            tx_ref = (o.payment_reference or '').strip()
-            if not tx_ref:
-                continue
-            v = verify_chapa_transaction(tx_ref)
-            v_status = (v.get('status') or '').lower()
-            v_data = v.get('data') or {}
-            paid_ok = (v_status == 'success') and ((v_data.get('status') or '').lower() == 'success')
-            if paid_ok:
-                o.status = 'completed'
-                o.payment_status = 'paid'
-                o.updated_at = datetime.utcnow()
-                reconciled.append(o.id)
-        if reconciled:
-            db.session.commit()
-        return jsonify({'ok': True, 'checked': len(candidates), 'updated': len(reconciled), 'orders': reconciled})
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Reconcile failed: {e}'}), 500
+@app.get('/admin/payments/reconcile/<job_id>')
+def admin_reconcile_status(job_id):
+    if not re.fullmatch(r'[0-9a-f]{12}', job_id or ''):
+        return jsonify({'error': 'Invalid job id'}), 400
+    progress = settings_cache.read_json(_job_path(job_id), default=None, ttl=0)
+    if progress is None:
+        return jsonify({'error': 'Reconcile job not found'}), 404
+    return jsonify(progress)
 
 @app.get('/admin/settings')
 def get_admin_settings():
@@ -2523,25 +4077,16 @@ def get_admin_settings():
 def put_admin_settings():
     try:
         data = request.get_json() or {}
-        instance_dir = Path(app.instance_path)
-        instance_dir.mkdir(parents=True, exist_ok=True)
-        settings_path = instance_dir / 'admin_settings.json'
-        with settings_path.open('w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        settings_cache.write_json(_admin_settings_path(), data)
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'error': f'Failed to save settings: {e}'}), 500
 
 @app.get('/admin/categories')
+@_conditional_get(_categories_watermark)
 def get_admin_categories():
     try:
-        instance_dir = Path(app.instance_path)
-        instance_dir.mkdir(parents=True, exist_ok=True)
-        path = instance_dir / 'admin_categories.json'
-        if path.exists():
-            with path.open('r', encoding='utf-8') as f:
-                return jsonify(json.load(f) or [])
-        return jsonify([])
+        return jsonify(_load_admin_categories())
     except Exception as e:
         return jsonify({'error': f'Failed to load categories: {e}'}), 500
 
@@ -2549,26 +4094,43 @@ def get_admin_categories():
 # Admin Metrics Endpoints
 # ----------------------
 
-def _dt_floor_day(dt: datetime) -> datetime:
-    return datetime(dt.year, dt.month, dt.day)
+def _metrics_range_start(default_days: int = 30) -> datetime:
+    """Translate ?range=30d|7d|1d into a UTC start timestamp."""
+    rng = (request.args.get('range') or f'{default_days}d').lower()
+    days = default_days
+    if rng.endswith('d'):
+        try: days = int(rng[:-1])
+        except: days = default_days
+    return datetime.utcnow() - timedelta(days=days)
+
+def _sql_day(col):
+    """Dialect-aware day bucket: date_trunc on Postgres, date() elsewhere (SQLite)."""
+    if db.engine.name == 'postgresql':
+        # Literal unit so SELECT and GROUP BY render the identical expression
+        return db.func.date_trunc(db.literal_column("'day'"), col)
+    return db.func.date(col)
+
+def _day_key(value) -> str:
+    """Normalize a _sql_day() result (datetime on Postgres, string on SQLite) to YYYY-MM-DD."""
+    if hasattr(value, 'strftime'):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
 
 @app.get('/admin/metrics/sales')
 def metrics_sales():
     try:
-        rng = (request.args.get('range') or '30d').lower()
-        days = 30
-        if rng.endswith('d'):
-            try: days = int(rng[:-1])
-            except: days = 30
-        start = datetime.utcnow() - timedelta(days=days)
-
-        orders = Order.query.filter(Order.payment_status=='paid', Order.updated_at >= start).all()
-        buckets = {}
-        for o in orders:
-            d = _dt_floor_day(o.updated_at or o.created_at or datetime.utcnow())
-            key = d.strftime('%Y-%m-%d')
-            buckets[key] = buckets.get(key, 0.0) + float(o.total_amount or 0.0)
-        series = sorted(([k, buckets[k]] for k in buckets.keys()), key=lambda x: x[0])
+        start = _metrics_range_start()
+        if _rollup_ready() and request.args.get('source') != 'raw':
+            rows = db.session.query(
+                DailySalesRollup.day, db.func.sum(DailySalesRollup.gross)
+            ).filter(DailySalesRollup.day >= start.date()).group_by(DailySalesRollup.day).order_by(DailySalesRollup.day).all()
+            return jsonify({'series': [[_day_key(d), round(float(amount or 0.0), 2)] for d, amount in rows]})
+        day = _sql_day(db.func.coalesce(Order.updated_at, Order.created_at))
+        rows = db.session.query(
+            day.label('day'),
+            db.func.sum(Order.total_amount).label('amount')
+        ).filter(Order.payment_status=='paid', Order.updated_at >= start).group_by(day).order_by(day).all()
+        series = [[_day_key(d), float(amount or 0.0)] for d, amount in rows if d is not None]
         return jsonify({'series': series})
     except Exception as e:
         return jsonify({'error': f'Failed to load sales metrics: {e}'}), 500
@@ -2576,17 +4138,13 @@ def metrics_sales():
 @app.get('/admin/metrics/orders/status')
 def metrics_orders_status():
     try:
-        rng = (request.args.get('range') or '30d').lower()
-        days = 30
-        if rng.endswith('d'):
-            try: days = int(rng[:-1])
-            except: days = 30
-        start = datetime.utcnow() - timedelta(days=days)
-        q = Order.query.filter(Order.created_at >= start)
+        start = _metrics_range_start()
+        rows = db.session.query(Order.status, db.func.count(Order.id)).filter(Order.created_at >= start).group_by(Order.status).all()
+        # Only a handful of grouped rows remain; fold case/NULL variants together here
         counts = {}
-        for o in q.all():
-            s = (o.status or 'pending').lower()
-            counts[s] = counts.get(s, 0) + 1
+        for status, n in rows:
+            s = (status or 'pending').lower()
+            counts[s] = counts.get(s, 0) + int(n or 0)
         return jsonify(counts)
     except Exception as e:
         return jsonify({'error': f'Failed to load order status metrics: {e}'}), 500
@@ -2594,28 +4152,35 @@ def metrics_orders_status():
 @app.get('/admin/metrics/vendors/top')
 def metrics_top_vendors():
     try:
-        rng = (request.args.get('range') or '30d').lower()
+        start = _metrics_range_start()
         limit = int(request.args.get('limit') or 10)
-        days = 30
-        if rng.endswith('d'):
-            try: days = int(rng[:-1])
-            except: days = 30
-        start = datetime.utcnow() - timedelta(days=days)
-        # Sum revenue by vendor for paid orders
-        rows = db.session.query(OrderItem, Order, Product).join(Order, OrderItem.order_id==Order.id).join(Product, OrderItem.product_id==Product.id).filter(Order.payment_status=='paid', Order.updated_at >= start).all()
-        rev = {}
-        for oi, o, p in rows:
-            amount = float(oi.price or 0.0) * float(oi.quantity or 0)
-            vid = p.vendor_id or 0
-            rev[vid] = rev.get(vid, 0.0) + amount
-        # Map vendor name
+        if _rollup_ready() and request.args.get('source') != 'raw':
+            revenue = db.func.sum(DailySalesRollup.gross)
+            rows = db.session.query(
+                DailySalesRollup.vendor_id, User.name, User.email, revenue
+            ).outerjoin(
+                User, DailySalesRollup.vendor_id==User.id
+            ).filter(
+                DailySalesRollup.day >= start.date()
+            ).group_by(DailySalesRollup.vendor_id, User.name, User.email).order_by(revenue.desc()).limit(limit).all()
+            return jsonify([{'vendor_id': vid or 0, 'vendor_name': name or email or f'Vendor {vid or 0}', 'revenue': round(float(amt or 0.0), 2)} for vid, name, email, amt in rows])
+        # Sum revenue by vendor for paid orders; vendor names come from the same query
+        revenue = db.func.sum(db.func.coalesce(OrderItem.price, 0.0) * db.func.coalesce(OrderItem.quantity, 0))
+        rows = db.session.query(
+            Product.vendor_id, User.name, User.email, revenue.label('revenue')
+        ).select_from(OrderItem).join(
+            Order, OrderItem.order_id==Order.id
+        ).join(
+            Product, OrderItem.product_id==Product.id
+        ).outerjoin(
+            User, Product.vendor_id==User.id
+        ).filter(
+            Order.payment_status=='paid', Order.updated_at >= start
+        ).group_by(Product.vendor_id, User.name, User.email).order_by(revenue.desc()).limit(limit).all()
         out = []
-        for vid, amt in rev.items():
-            vendor = User.query.get(vid)
-            name = vendor.name if vendor and getattr(vendor, 'name', None) else (vendor.email if vendor else f'Vendor {vid}')
-            out.append({'vendor_id': vid, 'vendor_name': name, 'revenue': round(amt, 2)})
-        out.sort(key=lambda x: x['revenue'], reverse=True)
-        return jsonify(out[:limit])
+        for vid, name, email, amt in rows:
+            out.append({'vendor_id': vid or 0, 'vendor_name': name or email or f'Vendor {vid or 0}', 'revenue': round(float(amt or 0.0), 2)})
+        return jsonify(out)
     except Exception as e:
         return jsonify({'error': f'Failed to load top vendors: {e}'}), 500
 
@@ -2709,12 +4274,20 @@ def get_order_invoice(order_id: int):
 
 @app.get('/admin/orders')
 def admin_list_orders():
-    """List recent orders with payment details and items for the admin dashboard.
-    Query params: range=30d, status=(optional)
+    """List recent orders with payment details for the admin dashboard, newest first.
+
+    Query params:
+      range: 30d|7d|1d (default 30d)
+      status: matches either order status or payment status (optional)
+      limit: page size (default 50, max 200); without limit or cursor the 200 newest
+             orders are returned, as AdminDashboard.vue expects
+      cursor: value of the X-Next-Cursor header from the previous page
+      include: 'items' to attach line items (two bulk queries per page)
     """
     try:
         rng = (request.args.get('range') or '30d').lower()
         status_filter = (request.args.get('status') or '').strip().lower()
+        include = {p.strip() for p in (request.args.get('include') or '').lower().split(',') if p.strip()}
         days = 30
         if rng.endswith('d'):
             try: days = int(rng[:-1])
@@ -2724,23 +4297,42 @@ def admin_list_orders():
         q = Order.query.filter(Order.created_at >= start)
         if status_filter:
             q = q.filter((Order.status == status_filter) | (Order.payment_status == status_filter))
-        q = q.order_by(Order.created_at.desc())
-
-        orders = []
-        for o in q.limit(200).all():
-            items = []
-            for oi in OrderItem.query.filter_by(order_id=o.id).all():
-                product = Product.query.get(oi.product_id)
-                items.append({
+        try:
+            paged = 'limit' in request.args or 'cursor' in request.args
+            limit, cursor_values = _page_args(default_limit=50 if paged else 200)
+            if cursor_values:
+                q = q.filter(_keyset_after(Order.created_at, Order.id, cursor_values))
+        except (ValueError, TypeError, IndexError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        page = q.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        items_by_order = None
+        if 'items' in include and page:
+            order_items = OrderItem.query.filter(OrderItem.order_id.in_([o.id for o in page])).order_by(OrderItem.id).all()
+            product_ids = {oi.product_id for oi in order_items}
+            products = {}
+            if product_ids:
+                products = {pid: (name, vid) for pid, name, vid in db.session.query(
+                    Product.id, Product.name, Product.vendor_id
+                ).filter(Product.id.in_(product_ids)).all()}
+            items_by_order = {}
+            for oi in order_items:
+                name, vid = products.get(oi.product_id, ('Unknown', None))
+                items_by_order.setdefault(oi.order_id, []).append({
                     'id': oi.id,
                     'product_id': oi.product_id,
-                    'product_name': product.name if product else 'Unknown',
-                    'vendor_id': product.vendor_id if product else None,
+                    'product_name': name,
+                    'vendor_id': vid,
                     'quantity': oi.quantity,
                     'price': oi.price,
                     'line_total': float(oi.price or 0.0) * float(oi.quantity or 0),
                 })
-            orders.append({
+
+        orders = []
+        for o in page:
+            row = {
                 'id': o.id,
                 'user_id': o.user_id,
                 'total_amount': o.total_amount,
@@ -2748,11 +4340,17 @@ def admin_list_orders():
                 'payment_status': o.payment_status,
                 'payment_method': o.payment_method,
                 'payment_reference': o.payment_reference,
+                'receipt_url': o.receipt_url,
                 'created_at': o.created_at.isoformat() if o.created_at else None,
                 'updated_at': o.updated_at.isoformat() if o.updated_at else None,
-                'items': items,
-            })
-        return jsonify(orders)
+            }
+            if items_by_order is not None:
+                row['items'] = items_by_order.get(o.id, [])
+            orders.append(row)
+        resp = jsonify(orders)
+        if has_more:
+            resp.headers['X-Next-Cursor'] = _encode_cursor(page[-1].created_at, page[-1].id)
+        return resp
     except Exception as e:
         return jsonify({'error': f'Failed to load orders: {e}'}), 500
 
@@ -2762,11 +4360,8 @@ def put_admin_categories():
         data = request.get_json() or []
         if not isinstance(data, list):
             return jsonify({'error': 'Categories must be a list'}), 400
-        instance_dir = Path(app.instance_path)
-        instance_dir.mkdir(parents=True, exist_ok=True)
-        path = instance_dir / 'admin_categories.json'
-        with path.open('w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        settings_cache.write_json(_admin_categories_path(), data)
+        _cache_invalidate('home')
         return jsonify({'ok': True})
     except Exception as e:
         return jsonify({'error': f'Failed to save categories: {e}'}), 500
@@ -3043,25 +4638,39 @@ def set_default_address(user_id, address_id):
 
 @app.get('/api/analytics/orders_summary')
 def analytics_orders_summary():
-    """Return order counters: total, pending, completed, cancelled, paid, failed."""
-    try:
-        total = db.session.query(db.func.count(Order.id)).scalar() or 0
-        pending = db.session.query(db.func.count(Order.id)).filter(Order.status == 'pending').scalar() or 0
-        # Treat confirmed (paid) as completed for dashboard purposes
-        completed = db.session.query(db.func.count(Order.id)).filter(
-            db.or_(Order.status.in_(['confirmed','completed']), Order.payment_status == 'paid')
-        ).scalar() or 0
-        cancelled = db.session.query(db.func.count(Order.id)).filter(Order.status == 'cancelled').scalar() or 0
-        paid = db.session.query(db.func.count(Order.id)).filter(Order.payment_status == 'paid').scalar() or 0
-        failed = db.session.query(db.func.count(Order.id)).filter(Order.payment_status == 'failed').scalar() or 0
-        return jsonify({
-            'total': total,
-            'pending': pending,
-            'completed': completed,
-            'cancelled': cancelled,
-            'paid': paid,
-            'failed': failed,
-        })
+    """Return order counters: total, pending, completed, cancelled, paid, failed.
+
+    One conditional-aggregation scan; optional range=30d|7d|1d limits it to recent orders.
+    Results are cached per worker for ANALYTICS_CACHE_TTL seconds to absorb dashboard polling.
+    """
+    try:
+        rng = (request.args.get('range') or '').strip().lower()
+
+        def load():
+            def count_if(cond):
+                return db.func.coalesce(db.func.sum(db.case((cond, 1), else_=0)), 0)
+            q = db.session.query(
+                db.func.count(Order.id),
+                count_if(Order.status == 'pending'),
+                # Treat confirmed (paid) as completed for dashboard purposes
+                count_if(db.or_(Order.status.in_(['confirmed','completed']), Order.payment_status == 'paid')),
+                count_if(Order.status == 'cancelled'),
+                count_if(Order.payment_status == 'paid'),
+                count_if(Order.payment_status == 'failed'),
+            )
+            if rng:
+                q = q.filter(Order.created_at >= _metrics_range_start())
+            total, pending, completed, cancelled, paid, failed = q.one()
+            return {
+                'total': int(total or 0),
+                'pending': int(pending or 0),
+                'completed': int(completed or 0),
+                'cancelled': int(cancelled or 0),
+                'paid': int(paid or 0),
+                'failed': int(failed or 0),
+            }
+
+        return jsonify(_cached(('orders_summary', rng), ANALYTICS_CACHE_TTL, load))
     except Exception as e:
         return jsonify({'error': f'Failed to load summary: {e}'}), 500
 
@@ -3072,15 +4681,16 @@ def analytics_sales_over_time():
         days = int(request.args.get('days') or 30)
         metric = (request.args.get('metric') or 'amount').lower()
         cutoff = datetime.utcnow() - timedelta(days=days)
+        day_col = _sql_day(Order.created_at)
         rows = db.session.query(
-            db.func.date(Order.created_at).label('day'),
+            day_col.label('day'),
             db.func.sum(Order.total_amount).label('amount'),
             db.func.count(Order.id).label('count')
-        ).filter(Order.created_at >= cutoff).group_by(db.func.date(Order.created_at)).order_by(db.func.date(Order.created_at)).all()
+        ).filter(Order.created_at >= cutoff).group_by(day_col).order_by(day_col).all()
         labels = []
         values = []
         for day, amount, count in rows:
-            labels.append(str(day))
+            labels.append(_day_key(day))
             values.append(float(amount or 0) if metric == 'amount' else int(count or 0))
         return jsonify({'labels': labels, 'values': values, 'metric': metric})
     except Exception as e:
@@ -3099,59 +4709,55 @@ def analytics_top_categories():
     except Exception as e:
         return jsonify({'error': f'Failed to load categories: {e}'}), 500
 
-@app.get('/admin/orders')
-def admin_orders_list():
-    """List recent orders for admin. Query: range=30d|7d|1d, limit=50"""
-    try:
-        rng = (request.args.get('range') or '30d').lower()
-        limit = min(int(request.args.get('limit') or 50), 200)
-        days = 30
-        if rng.endswith('d'):
-            try: days = int(rng[:-1])
-            except Exception: days = 30
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        orders = Order.query.filter(Order.created_at >= cutoff).order_by(Order.created_at.desc()).limit(limit).all()
-        out = []
-        for o in orders:
-            out.append({
-                'id': o.id,
-                'user_id': o.user_id,
-                'total_amount': o.total_amount,
-                'status': o.status,
-                'payment_status': o.payment_status,
-                'payment_method': o.payment_method,
-                'payment_reference': o.payment_reference,
-                'receipt_url': o.receipt_url,
-                'created_at': o.created_at.isoformat() if o.created_at else None
-            })
-        return jsonify(out)
-    except Exception as e:
-        return jsonify({'error': f'Failed to load orders: {e}'}), 500
-
 @app.get('/users/<int:user_id>/orders')
 def get_user_orders(user_id):
-    """Get all orders for a specific user"""
+    """Get a page of orders for a specific user, newest first.
+
+    Query params: limit (default 50, max 200), cursor (from the X-Next-Cursor response header).
+    Without limit or cursor every order is returned, as before paging existed (the order
+    views and OrderDetail rely on the full list). The body stays a plain list of orders;
+    X-Next-Cursor is only set when more orders exist.
+    """
     try:
-        orders = Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()
-        
-        orders_data = []
-        for order in orders:
-            # Get order items with product details
-            items = []
-            for item in OrderItem.query.filter_by(order_id=order.id).all():
-                product = Product.query.get(item.product_id)
-                items.append({
+        paged = 'limit' in request.args or 'cursor' in request.args
+        try:
+            limit, cursor_values = _page_args()
+            q = Order.query.filter(Order.user_id == user_id)
+            if cursor_values:
+                q = q.filter(_keyset_after(Order.created_at, Order.id, cursor_values))
+        except (ValueError, TypeError, IndexError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        q = q.order_by(Order.created_at.desc(), Order.id.desc())
+        if paged:
+            orders = q.limit(limit + 1).all()
+            has_more = len(orders) > limit
+            orders = orders[:limit]
+        else:
+            orders = q.all()
+            has_more = False
+
+        # Load items and their products for the whole page in one joined query
+        items_by_order = {}
+        if orders:
+            rows = db.session.query(OrderItem, Product.name, Product.image_url).outerjoin(
+                Product, OrderItem.product_id == Product.id
+            ).filter(OrderItem.order_id.in_([o.id for o in orders])).order_by(OrderItem.id).all()
+            for item, product_name, product_image in rows:
+                items_by_order.setdefault(item.order_id, []).append({
                     'id': item.id,
                     'product_id': item.product_id,
-                    'product_name': product.name if product else 'Unknown Product',
-                    'product_image': product.image_url if product else '',
+                    'product_name': product_name if product_name is not None else 'Unknown Product',
+                    'product_image': product_image if product_name is not None else '',
                     'quantity': item.quantity,
                     'price': item.price,
                     'line_total': float(item.price or 0) * float(item.quantity or 0),
                     'color': item.color,
                     'size': item.size
                 })
-            
+
+        orders_data = []
+        for order in orders:
+            items = items_by_order.get(order.id, [])
             orders_data.append({
                 'id': order.id,
                 'user_id': order.user_id,
@@ -3167,7 +4773,11 @@ def get_user_orders(user_id):
             })
         
         print(f"[DEBUG] Found {len(orders_data)} orders for user {user_id}")
-        return jsonify(orders_data)
+        resp = jsonify(orders_data)
+        if has_more:
+            last = orders[-1]
+            resp.headers['X-Next-Cursor'] = _encode_cursor(last.created_at, last.id)
+        return resp
         
     except Exception as e:
         print(f"[ERROR] Failed to load user orders: {e}")
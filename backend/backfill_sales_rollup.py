@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Rebuild the daily_sales_rollup table from paid order history.
+Run once after deploying the rollup, or any time the aggregates need repair.
+Sales reports read from the rollup only after a full run (without --since) has
+completed; until then they aggregate raw orders.
+
+Usage: python backfill_sales_rollup.py [--since YYYY-MM-DD]
+"""
+
+import argparse
+from datetime import datetime
+
+from app import app, db, _rollup_rebuild
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Rebuild daily sales rollup rows')
+    parser.add_argument('--since', help='only rebuild days on or after this date (YYYY-MM-DD)')
+    args = parser.parse_args()
+    since = datetime.strptime(args.since, '%Y-%m-%d') if args.since else None
+    with app.app_context():
+        db.create_all()
+        rows = _rollup_rebuild(since)
+        print(f"Rebuilt {rows} rollup row(s){' since ' + args.since if args.since else ''}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark cart resolution used by checkout and place-order.
+Compares the old per-line Product lookup against the batched IN (...) lookup
+and prints query count and latency for several cart sizes.
+
+Usage: python bench_checkout.py [--sizes 1,10,40,100] [--repeat 20]
+Runs against a throwaway SQLite database; your instance/app.db is not touched.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix='bench_checkout_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+from sqlalchemy import event
+
+from app import app, db, User, Product, _resolve_cart_lines
+
+
+def _legacy_resolve(items):
+    """Previous behaviour: one Product.query.get per cart line."""
+    vendor_to_lines = {}
+    total_amount = 0.0
+    for it in items:
+        pid = it.get('product_id')
+        qty = int(it.get('quantity') or 0)
+        if not pid or qty <= 0:
+            continue
+        product = db.session.get(Product, pid)
+        if not product:
+            continue
+        total_amount += product.price * qty
+        vendor_to_lines.setdefault(product.vendor_id or 0, []).append((product, qty))
+    return vendor_to_lines, total_amount
+
+
+def _seed(n_products: int, n_vendors: int = 5):
+    vendors = []
+    for i in range(n_vendors):
+        v = User(first_name='Vendor', last_name=str(i), name=f'Vendor {i}', email=f'vendor{i}@bench.local',
+                 password_hash='x', role='vendor')
+        db.session.add(v)
+        vendors.append(v)
+    db.session.flush()
+    for i in range(n_products):
+        db.session.add(Product(name=f'Product {i}', description='bench', price=10.0 + i, category='Bench',
+                               vendor_id=vendors[i % n_vendors].id, stock_quantity=100))
+    db.session.commit()
+
+
+def _measure(fn, items, repeat: int):
+    counter = {'n': 0}
+
+    def _count(*_args, **_kwargs):
+        counter['n'] += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _count)
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            # Expire the identity map so every run pays for its lookups
+            db.session.expunge_all()
+            fn(items)
+        elapsed = (time.perf_counter() - start) / repeat
+    finally:
+        event.remove(engine, 'before_cursor_execute', _count)
+    return counter['n'] // repeat, elapsed * 1000.0
+
+
+def run(sizes, repeat: int):
+    with app.app_context():
+        db.create_all()
+        _seed(max(sizes))
+        print(f"{'cart':>6} | {'legacy q':>8} {'legacy ms':>10} | {'batched q':>9} {'batched ms':>10}")
+        print('-' * 54)
+        for size in sizes:
+            items = [{'product_id': pid, 'quantity': 1} for pid in range(1, size + 1)]
+            lq, lms = _measure(_legacy_resolve, items, repeat)
+            bq, bms = _measure(_resolve_cart_lines, items, repeat)
+            print(f"{size:>6} | {lq:>8} {lms:>10.2f} | {bq:>9} {bms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,10,40,100')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run([int(s) for s in args.sizes.split(',') if s.strip()], args.repeat)
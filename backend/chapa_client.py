@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared HTTP client for the Chapa payment gateway.
+#
+# One requests.Session per process keeps TLS connections to the gateway alive and
+# pooled, so a payment does not pay for a fresh TCP + TLS handshake. Connect and read
+# timeouts are separate: a dead host fails fast, while a slow gateway response may take
+# longer. Only idempotent calls (verify) are retried, with exponential backoff and full
+# jitter. Every call records its latency per operation; see stats(). Callables appended
+# to `observers` are also called with (op, seconds, outcome) after every call.
+#
+# base_url is a constructor argument, so the client can be pointed at a local stub
+# (see chapa_stub.py) in development.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or did not answer in time."""
+
+
+class ChapaClient:
+    def __init__(self, base_url: str, secret_key: str, connect_timeout: float = 3.05, read_timeout: float = 15.0,
+                 pool_size: int = 10, verify_retries: int = 2, backoff: float = 0.25, slow_call_secs: float = 2.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify_retries = max(0, verify_retries)
+        self.backoff = backoff
+        self.slow_call_secs = slow_call_secs
+        self._secret_key = secret_key or ''
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self.observers = []
+
+    def _headers(self) -> dict:
+        # Sanitize secret to ASCII-only for HTTP headers
+        secret = self._secret_key.strip()
+        cleaned = ''.join(ch for ch in secret if ord(ch) < 128)
+        if cleaned != secret:
+            print('[WARN] CHAPA_SECRET_KEY contained non-ASCII characters; sanitized for header use.')
+        return {'Authorization': f'Bearer {cleaned}', 'Content-Type': 'application/json'}
+
+    def _entry(self, op: str) -> dict:
+        # Caller holds _stats_lock
+        return self._stats.setdefault(op, {
+            'count': 0, 'errors': 0, 'retries': 0, 'sum': 0.0, 'max': 0.0,
+            'buckets': [0] * len(LATENCY_BUCKETS),
+        })
+
+    def _observe(self, op: str, seconds: float, outcome: str):
+        with self._stats_lock:
+            entry = self._entry(op)
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            if outcome != 'ok':
+                entry['errors'] += 1
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if seconds <= le:
+                    entry['buckets'][i] += 1
+        for fn in self.observers:
+            try:
+                fn(op, seconds, outcome)
+            except Exception as e:
+                print(f"[WARN] Chapa observer failed: {e}")
+        if seconds >= self.slow_call_secs:
+            print(f"[WARN] Chapa {op} took {seconds * 1000:.0f}ms ({outcome})")
+
+    def _count_retry(self, op: str):
+        with self._stats_lock:
+            self._entry(op)['retries'] += 1
+
+    def stats(self) -> dict:
+        """Per-operation latency stats: count, errors, retries, sum/max seconds, cumulative buckets."""
+        with self._stats_lock:
+            return {op: dict(entry, buckets=list(entry['buckets'])) for op, entry in self._stats.items()}
+
+    def _request(self, op: str, method: str, path: str, json=None, retries: int = 0):
+        """Return (status_code, parsed body). Raises GatewayError once attempts are exhausted."""
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                resp = self._session.request(method, url, headers=self._headers(), json=json, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._observe(op, time.perf_counter() - start, 'error')
+                if attempt >= retries:
+                    raise GatewayError(str(e)) from e
+            else:
+                elapsed = time.perf_counter() - start
+                if resp.status_code in RETRY_STATUSES and attempt < retries:
+                    self._observe(op, elapsed, f'http_{resp.status_code}')
+                    resp.close()  # hand the connection back to the pool before retrying
+                else:
+                    self._observe(op, elapsed, 'ok' if resp.status_code < 400 else f'http_{resp.status_code}')
+                    try:
+                        return resp.status_code, resp.json()
+                    except ValueError:
+                        return resp.status_code, {'status_code': resp.status_code, 'text': resp.text}
+            attempt += 1
+            self._count_retry(op)
+            # Full jitter: sleep a random fraction of the exponential backoff window
+            time.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+
+    def initialize(self, payload: dict):
+        """POST /v1/transaction/initialize. Not retried: a duplicate could open a second session."""
+        return self._request('initialize', 'POST', '/v1/transaction/initialize', json=payload)
+
+    def verify(self, tx_ref: str):
+        """GET /v1/transaction/verify/<tx_ref>, retried on network errors, 429 and 5xx."""
+        return self._request('verify', 'GET', f'/v1/transaction/verify/{tx_ref}', retries=self.verify_retries)
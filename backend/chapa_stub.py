@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Chapa API, for exercising the gateway client without network access.
+Implements POST /v1/transaction/initialize and GET /v1/transaction/verify/<tx_ref>.
+
+Usage: python chapa_stub.py [--port 8099] [--latency 0.2] [--error-rate 0.1] [--verify-status success|failed]
+Then run the backend with CHAPA_BASE_URL=http://127.0.0.1:8099
+"""
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(args):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+
+        def _reply(self, code: int, body: dict):
+            raw = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _simulate(self) -> bool:
+            time.sleep(args.latency)
+            if random.random() < args.error_rate:
+                self._reply(503, {'status': 'failed', 'message': 'stub: simulated outage'})
+                return False
+            return True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if self.path != '/v1/transaction/initialize':
+                return self._reply(404, {'status': 'failed', 'message': 'not found'})
+            if self._simulate():
+                tx_ref = payload.get('tx_ref', '')
+                self._reply(200, {'status': 'success', 'data': {'checkout_url': f'http://127.0.0.1:{args.port}/checkout/{tx_ref}'}})
+
+        def do_GET(self):
+            prefix = '/v1/transaction/verify/'
+            if not self.path.startswith(prefix):
+                return self._reply(404, {'status': 'failed', 'message': 'not found'})
+            if self._simulate():
+                tx_ref = self.path[len(prefix):]
+                self._reply(200, {'status': 'success', 'data': {'status': args.verify_status, 'tx_ref': tx_ref, 'amount': '100.00', 'currency': 'ETB'}})
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    parser.add_argument('--verify-status', default='success', help="data.status returned by verify")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args))
+    print(f"Chapa stub listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# Connection pool that measures how long callers wait for a connection.
+#
+# Every checkout through connect() is timed, including waits for a free slot and the
+# pre-ping. Pool exhaustion (sqlalchemy.exc.TimeoutError) is counted. Recent waits are
+# kept so health checks can see saturation without taking a connection themselves, and
+# observers (e.g. metrics) are called after every checkout.
+
+
+class MeteredQueuePool(QueuePool):
+    observers = []  # fn(pool, wait_seconds, timed_out), shared by every instance
+    RECENT_WINDOW_SECS = 60.0
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.max_overflow = max_overflow
+        self.timeouts = 0
+        self._waits = deque(maxlen=512)  # (monotonic time, seconds)
+        self._waits_lock = threading.Lock()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            self._record(time.perf_counter() - start, timed_out=True)
+            raise
+        self._record(time.perf_counter() - start, timed_out=False)
+        return conn
+
+    def _record(self, seconds: float, timed_out: bool):
+        with self._waits_lock:
+            self._waits.append((time.monotonic(), seconds))
+            if timed_out:
+                self.timeouts += 1
+        for fn in self.observers:
+            try:
+                fn(self, seconds, timed_out)
+            except Exception as e:
+                print(f"[WARN] Pool observer failed: {e}")
+
+    def recent_wait(self, window: float = RECENT_WINDOW_SECS) -> float:
+        """Longest checkout wait (seconds) seen in the last `window` seconds, 0.0 if none."""
+        cutoff = time.monotonic() - window
+        with self._waits_lock:
+            return max((secs for at, secs in self._waits if at >= cutoff), default=0.0)
+
+    def usage(self) -> dict:
+        return {
+            'size': self.size(),
+            'max_overflow': self.max_overflow,
+            'checked_out': self.checkedout(),
+            'overflow': max(0, self.overflow()),
+            'timeouts': self.timeouts,
+        }
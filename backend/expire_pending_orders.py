@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Cancel abandoned Chapa checkouts (payment_method 'chapa', still pending and unpaid)
+older than orders.orderAutoExpireMins (admin settings) and release their stock
+reservations. COD and bank-transfer orders are never expired. Safe to run alongside the in-app sweeper.
+
+Usage: python expire_pending_orders.py [--batch-size 200] [--max-batches N] [--loop SECONDS]
+"""
+
+import argparse
+import time
+
+from app import app, db, _expire_stale_orders, _order_expiry_minutes, ORDER_EXPIRY_BATCH
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Expire abandoned Chapa checkouts')
+    parser.add_argument('--batch-size', type=int, default=ORDER_EXPIRY_BATCH)
+    parser.add_argument('--max-batches', type=int, help='stop after this many batches per sweep')
+    parser.add_argument('--loop', type=float, help='keep sweeping every SECONDS instead of exiting')
+    args = parser.parse_args()
+    with app.app_context():
+        db.create_all()
+        if not _order_expiry_minutes():
+            print("orders.orderAutoExpireMins is not set; nothing to do.")
+            return
+        while True:
+            expired = _expire_stale_orders(args.batch_size, args.max_batches)
+            print(f"Expired {expired} abandoned Chapa checkout(s).")
+            if not args.loop:
+                break
+            time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
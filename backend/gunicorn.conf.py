@@ -0,0 +1,25 @@
+# Loaded automatically by gunicorn when started from this directory (see Procfile).
+#
+# Prometheus multiprocess mode: every worker writes its metrics to files under
+# PROMETHEUS_MULTIPROC_DIR and GET /metrics on any worker merges them. The directory is
+# emptied when the master starts, and files of exited workers are marked dead so their
+# live gauges (in-flight requests, pool usage) stop counting.
+
+import os
+import shutil
+import tempfile
+
+_metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'afrashop-metrics'))
+
+
+def on_starting(server):
+    shutil.rmtree(_metrics_dir, ignore_errors=True)
+    os.makedirs(_metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
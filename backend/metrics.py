@@ -0,0 +1,119 @@
+import os
+
+from chapa_client import LATENCY_BUCKETS as CHAPA_LATENCY_BUCKETS
+
+try:
+    import prometheus_client as prom  # optional: enables GET /metrics
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prom = None
+
+# Prometheus metrics for the backend.
+#
+# Under gunicorn every worker is a separate process, so each would otherwise expose only
+# its own counters. When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) the
+# client library keeps values in per-process files in that directory and render() merges
+# them: counters and histograms are summed, gauges are summed over live processes.
+# Values that are global rather than per process (e.g. mail outbox depth) are read at
+# scrape time through gauge_callback() and not merged.
+#
+# Without prometheus_client installed every function here is a no-op and render()
+# returns None.
+
+ENABLED = prom is not None
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+_callbacks = []  # (name, documentation, fn) read at scrape time
+
+if ENABLED:
+    if MULTIPROC_DIR:
+        os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    REQUESTS = prom.Counter('http_requests_total', 'HTTP requests handled', ['method', 'route', 'status'])
+    REQUEST_LATENCY = prom.Histogram('http_request_duration_seconds', 'HTTP request latency',
+                                     ['method', 'route'], buckets=REQUEST_BUCKETS)
+    IN_FLIGHT = prom.Gauge('http_requests_in_flight', 'HTTP requests being handled', multiprocess_mode='livesum')
+    POOL_SIZE = prom.Gauge('db_pool_size', 'Configured connection pool size', multiprocess_mode='livesum')
+    POOL_CHECKED_OUT = prom.Gauge('db_pool_checked_out', 'Connections checked out of the pool', multiprocess_mode='livesum')
+    POOL_OVERFLOW = prom.Gauge('db_pool_overflow', 'Connections open beyond the pool size', multiprocess_mode='livesum')
+    POOL_WAIT = prom.Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                               buckets=POOL_WAIT_BUCKETS)
+    POOL_TIMEOUTS = prom.Counter('db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a connection')
+    CHAPA_LATENCY = prom.Histogram('chapa_request_duration_seconds', 'Chapa gateway call latency',
+                                   ['op', 'outcome'], buckets=CHAPA_LATENCY_BUCKETS)
+
+    class _CallbackCollector:
+        def collect(self):
+            for name, documentation, fn in _callbacks:
+                try:
+                    value = fn()
+                except Exception as e:
+                    print(f"[WARN] Metric {name} unavailable: {e}")
+                    continue
+                if value is not None:
+                    yield GaugeMetricFamily(name, documentation, value=value)
+
+    _callback_collector = _CallbackCollector()
+    if not MULTIPROC_DIR:
+        prom.REGISTRY.register(_callback_collector)
+
+
+def request_started():
+    if ENABLED:
+        IN_FLIGHT.inc()
+
+
+def request_finished():
+    if ENABLED:
+        IN_FLIGHT.dec()
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    if ENABLED:
+        REQUESTS.labels(method, route, str(status)).inc()
+        REQUEST_LATENCY.labels(method, route).observe(seconds)
+
+
+def sample_pool(pool):
+    """Record the pool's current occupancy (pool must provide usage(), see db_pool.py)."""
+    if ENABLED:
+        usage = pool.usage()
+        POOL_SIZE.set(usage['size'])
+        POOL_CHECKED_OUT.set(usage['checked_out'])
+        POOL_OVERFLOW.set(usage['overflow'])
+
+
+def observe_pool(pool, seconds: float, timed_out: bool):
+    """MeteredQueuePool observer."""
+    if ENABLED:
+        POOL_WAIT.observe(seconds)
+        if timed_out:
+            POOL_TIMEOUTS.inc()
+        sample_pool(pool)
+
+
+def observe_chapa(op: str, seconds: float, outcome: str):
+    """ChapaClient observer."""
+    if ENABLED:
+        CHAPA_LATENCY.labels(op, outcome).observe(seconds)
+
+
+def gauge_callback(name: str, documentation: str, fn):
+    """Expose fn() (a number, or None to skip) as a gauge computed at scrape time."""
+    _callbacks.append((name, documentation, fn))
+
+
+def render():
+    """(body, content type) in the Prometheus text format, or None if metrics are disabled."""
+    if not ENABLED:
+        return None
+    if MULTIPROC_DIR:
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_callback_collector)
+    else:
+        registry = prom.REGISTRY
+    return prom.generate_latest(registry), prom.CONTENT_TYPE_LATEST
@@ -0,0 +1,111 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL statistics collected from SQLAlchemy cursor events.
+#
+# A QueryStats collector counts statements, sums their wall time and groups them by
+# fingerprint: the SQL text with literals, bind placeholders and IN-lists collapsed, so
+# "SELECT ... WHERE id = 1" and "... id = 2" share a shape. Many executions of one shape
+# in a single request is the signature of an N+1 loop.
+#
+# Collectors are held in a ContextVar, so only statements issued by the code that
+# started one (a request, a test) are counted; background worker threads are unaffected.
+# Collectors nest, which lets a test wrap a request that is also instrumented by the app:
+#
+#     with query_stats.track() as qs:
+#         client.get('/products')
+#     assert qs.count <= 3, qs.summary()
+
+_active = ContextVar('query_stats_active', default=())
+_installed = False
+_install_lock = threading.Lock()
+
+_WS = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PARAM = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|\?')
+_IN_LIST = re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a SQL statement to its shape (literals and bind values replaced by ?)."""
+    sql = _WS.sub(' ', statement).strip()
+    sql = _STRING.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('IN (?, ...)', sql)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[fingerprint(statement)] += 1
+
+    def repeated(self, threshold: int) -> list:
+        """[(fingerprint, count)] for shapes executed more than threshold times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+    def summary(self) -> str:
+        lines = [f"{self.count} queries, {self.seconds * 1000:.1f}ms"]
+        lines += [f"  {n:>4}x {shape[:200]}" for shape, n in self.shapes.most_common(10)]
+        return '\n'.join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('query_stats_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active.get()
+    if not collectors:
+        return
+    starts = conn.info.get('query_stats_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    for stats in collectors:
+        stats.record(statement, elapsed)
+
+
+def install():
+    """Attach the cursor listeners to every Engine (idempotent)."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _installed = True
+
+
+def start():
+    """Begin collecting for the current context. Returns (stats, token) for stop()."""
+    install()
+    stats = QueryStats()
+    return stats, _active.set(_active.get() + (stats,))
+
+
+def stop(token):
+    _active.reset(token)
+
+
+@contextmanager
+def track():
+    """Collect statements issued inside the block; yields the QueryStats."""
+    stats, token = start()
+    try:
+        yield stats
+    finally:
+        stop(token)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Recompute the product_rating aggregates from the review table.
+Run once after deploying the table, or any time the aggregates need repair.
+
+Usage: python repair_product_ratings.py [--product-id ID]
+"""
+
+import argparse
+
+from app import app, db, _ratings_rebuild
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Recompute product rating aggregates')
+    parser.add_argument('--product-id', type=int, help='only repair this product')
+    args = parser.parse_args()
+    with app.app_context():
+        db.create_all()
+        rows = _ratings_rebuild(args.product_id)
+        print(f"Rebuilt rating aggregates for {rows} product(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Cache for small JSON documents kept under the Flask instance folder
+# (admin_settings.json, admin_categories.json).
+#
+# Each entry is revalidated with a cheap os.stat() at most once per `ttl` seconds.
+# The file signature (mtime_ns, size, inode) changes on every write made through
+# write_json(), which replaces the file atomically, so other gunicorn workers pick
+# up a change on their next revalidation without any shared state.
+
+DEFAULT_TTL = float(os.getenv('SETTINGS_CACHE_TTL', '2'))
+
+_entries = {}  # path -> {'sig': tuple, 'checked': float, 'doc': object}
+_lock = threading.Lock()
+
+
+def signature(path: str):
+    """Cheap change detector for a file: (mtime_ns, size, inode), or None if it is missing."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def read_json(path: str, default=None, ttl: float = DEFAULT_TTL):
+    """Return the parsed JSON document at path (a private copy), or default if missing/invalid."""
+    path = os.fspath(path)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(path)
+        if entry and now - entry['checked'] < ttl:
+            return copy.deepcopy(entry['doc'])
+
+    sig = signature(path)
+    if entry and entry['sig'] == sig:
+        with _lock:
+            entry['checked'] = now
+        return copy.deepcopy(entry['doc'])
+
+    doc = default
+    if sig is not None:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except Exception:
+            doc = default
+    with _lock:
+        _entries[path] = {'sig': sig, 'checked': now, 'doc': doc}
+    return copy.deepcopy(doc)
+
+
+def write_json(path: str, data) -> None:
+    """Atomically replace the JSON document at path and drop the cached copy."""
+    path = os.fspath(path)
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    invalidate(path)
+
+
+def invalidate(path: str = None) -> None:
+    """Forget the cached copy of one file, or of every file when path is None."""
+    with _lock:
+        if path is None:
+            _entries.clear()
+        else:
+            _entries.pop(os.fspath(path), None)
+
+
+def touch(path: str) -> None:
+    """Bump a generation marker file so every worker sees a new signature().
+
+    The marker is replaced atomically (new inode), which also works on filesystems
+    with coarse mtime resolution.
+    """
+    write_json(path, {'generation': time.time_ns()})
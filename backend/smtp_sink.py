@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Local SMTP sink for exercising the mail outbox without a real mail server.
+Accepts every message, prints a one-line summary and counts connections, so you can
+check that a batch is delivered over a single connection.
+
+Usage: python smtp_sink.py [--port 1025] [--fail-rate 0.1] [--verbose]
+Then run the backend with MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_USE_TLS=false
+"""
+
+import argparse
+import random
+import socketserver
+import threading
+
+_counts = {'connections': 0, 'messages': 0}
+_counts_lock = threading.Lock()
+
+
+def make_handler(args):
+    class Handler(socketserver.StreamRequestHandler):
+        def _reply(self, line: str):
+            self.wfile.write(f'{line}\r\n'.encode('ascii'))
+
+        def _read_data(self) -> bytes:
+            lines = []
+            while True:
+                line = self.rfile.readline()
+                if not line or line.rstrip(b'\r\n') == b'.':
+                    return b''.join(lines)
+                if line.startswith(b'..'):
+                    line = line[1:]  # undo dot-stuffing
+                lines.append(line)
+
+        def handle(self):
+            with _counts_lock:
+                _counts['connections'] += 1
+                conn_no = _counts['connections']
+            self._reply('220 smtp-sink ready')
+            mail_from, rcpt_to = None, []
+            while True:
+                raw = self.rfile.readline()
+                if not raw:
+                    return
+                line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+                verb = line.split(' ', 1)[0].upper()
+                if args.verbose:
+                    print(f"[conn {conn_no}] {line}")
+                if verb == 'EHLO':
+                    self._reply('250-smtp-sink')
+                    self._reply('250 8BITMIME')
+                elif verb == 'HELO':
+                    self._reply('250 smtp-sink')
+                elif verb == 'MAIL':
+                    mail_from, rcpt_to = line[10:].strip(), []
+                    self._reply('250 OK')
+                elif verb == 'RCPT':
+                    rcpt_to.append(line[8:].strip())
+                    self._reply('250 OK')
+                elif verb == 'DATA':
+                    self._reply('354 End data with <CR><LF>.<CR><LF>')
+                    body = self._read_data()
+                    if random.random() < args.fail_rate:
+                        self._reply('451 smtp-sink: simulated temporary failure')
+                        continue
+                    with _counts_lock:
+                        _counts['messages'] += 1
+                        total = _counts['messages']
+                    subject = next((l[9:] for l in body.decode('utf-8', 'replace').splitlines()
+                                    if l.lower().startswith('subject: ')), '')
+                    print(f"#{total} conn={conn_no} from={mail_from} to={','.join(rcpt_to)} subject={subject!r}")
+                    self._reply('250 OK: queued')
+                elif verb in ('RSET', 'NOOP'):
+                    if verb == 'RSET':
+                        mail_from, rcpt_to = None, []
+                    self._reply('250 OK')
+                elif verb == 'QUIT':
+                    self._reply('221 Bye')
+                    return
+                else:
+                    self._reply('502 Command not implemented')
+
+    return Handler
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of messages answered with 451')
+    parser.add_argument('--verbose', action='store_true', help='print every SMTP command')
+    args = parser.parse_args()
+    server = _Server(('127.0.0.1', args.port), make_handler(args))
+    print(f"SMTP sink listening on 127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()